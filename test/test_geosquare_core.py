@@ -0,0 +1,257 @@
+# coding=utf-8
+"""Geosquare arithmetic core test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'admin@geosquare.ai'
+__date__ = '2025-04-17'
+__copyright__ = 'Copyright 2025, PT Geo Inovasi Nusantara'
+
+import unittest
+
+import numpy as np
+
+from tools import geosquare_core
+
+
+def iterative_bound(gid):
+    """Reference decoder narrowing float ranges one level at a time."""
+    lat_ranged = (-216, 233.157642055036)
+    lon_ranged = (-217, 232.157642055036)
+    for idx, char in enumerate(gid):
+        part = geosquare_core.LEVEL_PARTS[idx]
+        value_y, value_x = geosquare_core.CODE_VALUE[char]
+        part_x = (lon_ranged[1] - lon_ranged[0]) / part
+        part_y = (lat_ranged[1] - lat_ranged[0]) / part
+        lon_ranged = (lon_ranged[0] + part_x * value_x,
+                      lon_ranged[0] + part_x * (value_x + 1))
+        lat_ranged = (lat_ranged[0] + part_y * value_y,
+                      lat_ranged[0] + part_y * (value_y + 1))
+    return lon_ranged[0], lat_ranged[0], lon_ranged[1], lat_ranged[1]
+
+
+class GeosquareCoreCodecTest(unittest.TestCase):
+    """Test the closed-form integer codec."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(3)
+        self.longitude = rng.uniform(-180, 180, 500)
+        self.latitude = rng.uniform(-90, 90, 500)
+
+    def test_matches_iterative_decoder(self):
+        """Closed-form bounds agree with float range narrowing."""
+        for lon, lat in zip(self.longitude, self.latitude):
+            column, row = geosquare_core.lonlat_to_index(lon, lat, 15)
+            gid = geosquare_core.index_to_gid(column, row, 15)
+            bound = geosquare_core.index_to_bound(column, row, 15)
+            np.testing.assert_allclose(
+                bound, iterative_bound(gid), rtol=0, atol=1e-9)
+            self.assertTrue(bound[0] <= lon < bound[2])
+            self.assertTrue(bound[1] <= lat < bound[3])
+
+    def test_round_trip(self):
+        """Index and GID conversions are inverse to each other."""
+        for level in range(1, geosquare_core.MAX_LEVEL + 1):
+            column, row = geosquare_core.lonlat_to_index_array(
+                self.longitude, self.latitude, level)
+            gids = geosquare_core.index_to_gid_array(column, row, level)
+            back_column, back_row, lengths = \
+                geosquare_core.gid_to_index_array(gids)
+            np.testing.assert_array_equal(back_column, column)
+            np.testing.assert_array_equal(back_row, row)
+            np.testing.assert_array_equal(lengths, level)
+            self.assertEqual(
+                geosquare_core.gid_to_index(gids[0]),
+                (column[0], row[0]))
+            self.assertEqual(
+                geosquare_core.index_to_gid(column[0], row[0], level),
+                gids[0])
+
+    def test_hierarchy(self):
+        """Every cell lies inside its parent."""
+        for level in range(2, geosquare_core.MAX_LEVEL + 1):
+            child = geosquare_core.lonlat_to_index_array(
+                self.longitude, self.latitude, level)
+            parent = geosquare_core.lonlat_to_index_array(
+                self.longitude, self.latitude, level - 1)
+            part = geosquare_core.LEVEL_PARTS[level - 1]
+            np.testing.assert_array_equal(child[0] // part, parent[0])
+            np.testing.assert_array_equal(child[1] // part, parent[1])
+
+    def test_invalid_gid(self):
+        """Unknown characters raise ValueError."""
+        with self.assertRaises(ValueError):
+            geosquare_core.gid_to_index('J1')
+        with self.assertRaises(ValueError):
+            geosquare_core.gid_to_index_array(['J1'])
+
+    def test_digit_out_of_level(self):
+        """Characters outside the 2x2 block of a level split in 2 raise ValueError."""
+        with self.assertRaises(ValueError):
+            geosquare_core.gid_to_index('JY')
+        with self.assertRaises(ValueError):
+            geosquare_core.gid_to_index_array(['J2', 'JY'])
+        self.assertEqual(
+            geosquare_core.gid_to_index_array(['J2'])[2].tolist(), [2])
+
+
+class GeosquareCoreScanlineTest(unittest.TestCase):
+    """Test scanline coverage of polygons."""
+
+    level = 9
+
+    def setUp(self):
+        """Runs before each test."""
+        self.size = geosquare_core.CELL_SIZE[self.level]
+        self.origin = geosquare_core.index_to_bound(
+            *geosquare_core.lonlat_to_index(106.8, -6.2, self.level),
+            self.level)
+
+    def coverage(self, polygons, window=None):
+        """Collect the coverage of polygons into a dict keyed by index."""
+        result = {}
+        for columns, rows, fractions in geosquare_core.polygon_coverage(
+                polygons, self.level, window):
+            for column, row, fraction in zip(columns, rows, fractions):
+                result[(column, row)] = fraction
+        return result
+
+    def rectangle(self, x0, y0, x1, y1):
+        """Ring of a rectangle given in cell units from the origin cell."""
+        x0, x1 = (self.origin[0] + x * self.size for x in (x0, x1))
+        y0, y1 = (self.origin[1] + y * self.size for y in (y0, y1))
+        return np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)])
+
+    def test_rectangle_fractions(self):
+        """An offset rectangle covers its edge cells partially."""
+        coverage = self.coverage([[self.rectangle(0.5, 0.25, 3, 2)]])
+        column, row = geosquare_core.lonlat_to_index(
+            self.origin[0], self.origin[1], self.level)
+        self.assertEqual(len(coverage), 6)
+        self.assertAlmostEqual(coverage[(column, row)], 0.375)
+        self.assertAlmostEqual(coverage[(column + 1, row)], 0.75)
+        self.assertAlmostEqual(coverage[(column, row + 1)], 0.5)
+        self.assertAlmostEqual(coverage[(column + 2, row + 1)], 1.0)
+
+    def test_hole_and_orientation(self):
+        """Holes are subtracted whatever the ring orientation."""
+        outer = self.rectangle(0, 0, 4, 4)[::-1]
+        hole = self.rectangle(1, 1, 3, 3)
+        coverage = self.coverage([[outer, hole]])
+        self.assertAlmostEqual(sum(coverage.values()), 12)
+        self.assertEqual(len(coverage), 12)
+
+    def test_triangle_area_and_window(self):
+        """Coverage sums to the polygon area and windows partition it."""
+        triangle = np.array([
+            (106.80, -6.20), (106.95, -6.18), (106.83, -6.07), (106.80, -6.20)
+        ])
+        polygons = [[triangle]]
+        coverage = self.coverage(polygons)
+        area = 0.5 * abs(
+            (triangle[1, 0] - triangle[0, 0]) * (triangle[2, 1] - triangle[0, 1])
+            - (triangle[2, 0] - triangle[0, 0]) * (triangle[1, 1] - triangle[0, 1]))
+        self.assertAlmostEqual(
+            sum(coverage.values()) * self.size ** 2, area, places=12)
+
+        window = geosquare_core.window_for_bounds(
+            *geosquare_core.polygons_bounds(polygons), self.level)
+        middle = (window[0] + window[2]) // 2
+        left = self.coverage(polygons, (window[0], window[1], middle, window[3]))
+        right = self.coverage(polygons, (middle, window[1], window[2], window[3]))
+        self.assertEqual(set(left) | set(right), set(coverage))
+        for key, fraction in {**left, **right}.items():
+            self.assertAlmostEqual(fraction, coverage[key])
+
+    def test_points_in_polygons(self):
+        """Points in holes and outside the exterior are outside."""
+        polygons = [[
+            np.array([(0.0, 0.0), (4.0, 0.0), (4.0, 4.0), (0.0, 4.0)]),
+            np.array([(1.0, 1.0), (1.0, 3.0), (3.0, 3.0), (3.0, 1.0)]),
+        ]]
+        x = np.array([0.5, 2.0, 3.5, 5.0, 2.0])
+        y = np.array([0.5, 2.0, 2.0, 2.0, 3.5])
+        self.assertEqual(
+            geosquare_core.points_in_polygons(x, y, polygons).tolist(),
+            [True, False, True, False, True])
+
+    def test_polyfill_index_threshold(self):
+        """Interior-only polyfill keeps cells covered by more than half."""
+        polygons = [[self.rectangle(0.5, 0.25, 3, 2)]]
+        full = np.concatenate([
+            columns for columns, _ in geosquare_core.polyfill_index(
+                polygons, self.level, fullcover=True)])
+        interior = np.concatenate([
+            columns for columns, _ in geosquare_core.polyfill_index(
+                polygons, self.level, fullcover=False)])
+        self.assertEqual(len(full), 6)
+        self.assertEqual(len(interior), 4)
+
+
+class GeosquareCoreDescendantTest(unittest.TestCase):
+    """Test the closed-form descendant enumeration."""
+
+    def test_descendant_index(self):
+        """Descendants match repeated child expansion, in GID order."""
+        for gid, level in (('J3N2M2Q', 7), ('J3N2M2Q', 9), ('J3N2M', 8), ('2', 3)):
+            expected = [gid]
+            while len(expected[0]) < level:
+                expected = [
+                    key + code
+                    for key in expected
+                    for code in sorted(geosquare_core.CODE_VALUE)
+                    if geosquare_core.CODE_VALUE[code][0] < geosquare_core.LEVEL_PARTS[len(key)]
+                    and geosquare_core.CODE_VALUE[code][1] < geosquare_core.LEVEL_PARTS[len(key)]
+                ]
+            columns, rows = geosquare_core.descendant_index(gid, level)
+            self.assertEqual(
+                list(geosquare_core.index_to_gid_array(columns, rows, level)), expected)
+
+    def test_enclosing_cell(self):
+        """The enclosing cell is the finest one holding both corners."""
+        bounds = (106.80, -6.20, 106.95, -6.07)
+        gid = geosquare_core.enclosing_cell(*bounds)
+        xmin, ymin, xmax, ymax = geosquare_core.index_to_bound(
+            *geosquare_core.gid_to_index(gid), len(gid))
+        self.assertTrue(xmin <= bounds[0] and ymin <= bounds[1])
+        self.assertTrue(xmax > bounds[2] and ymax > bounds[3])
+        # no child holds both corners
+        self.assertNotEqual(
+            geosquare_core.lonlat_to_index(bounds[0], bounds[1], len(gid) + 1),
+            geosquare_core.lonlat_to_index(bounds[2], bounds[3], len(gid) + 1))
+        self.assertEqual(geosquare_core.enclosing_cell(*bounds, max_level=3), gid[:3])
+        self.assertEqual(geosquare_core.enclosing_cell(-300, 0, -299, 1), '')
+
+
+class GeosquareCoreTileTest(unittest.TestCase):
+    """Test polyfilling a single parent tile."""
+
+    def test_polyfill_tile(self):
+        """Tiles partition the polygon and return sorted GIDs."""
+        polygons = [[np.array([
+            (106.80, -6.20), (106.95, -6.18), (106.83, -6.07), (106.80, -6.20)
+        ])]]
+        level = 10
+        expected = sorted(
+            gid
+            for columns, rows in geosquare_core.polyfill_index(polygons, level)
+            for gid in geosquare_core.index_to_gid_array(columns, rows, level))
+        tiles = sorted({gid[:7] for gid in expected})
+        result = []
+        for tile in tiles:
+            gids = geosquare_core.polyfill_tile(tile, polygons, level)
+            self.assertEqual(list(gids), sorted(gids))
+            self.assertTrue(all(gid.startswith(tile) for gid in gids))
+            result.extend(gids)
+        self.assertEqual(result, expected)
+        self.assertEqual(len(geosquare_core.polyfill_tile(tiles[0], [], level)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,339 @@
+# coding=utf-8
+"""Geosquare grid core test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'admin@geosquare.ai'
+__date__ = '2025-04-17'
+__copyright__ = 'Copyright 2025, PT Geo Inovasi Nusantara'
+
+import unittest
+
+import numpy as np
+from qgis.core import QgsGeometry, QgsProcessingFeedback
+
+from tools.geosquare_grid import GeosquareGrid
+from tools.grid_cache import GridCache
+
+
+class GeosquareGridArrayTest(unittest.TestCase):
+    """Test the vectorized batch conversion methods."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.grid = GeosquareGrid()
+        rng = np.random.default_rng(42)
+        self.longitude = rng.uniform(-180, 180, 500)
+        self.latitude = rng.uniform(-90, 90, 500)
+
+    def test_lonlat_to_gid_array(self):
+        """Batch encoding matches the scalar encoder at every level."""
+        for level in range(1, 16):
+            gids = self.grid.lonlat_to_gid_array(
+                self.longitude, self.latitude, level)
+            expected = [
+                self.grid.lonlat_to_gid(lon, lat, level)
+                for lon, lat in zip(self.longitude, self.latitude)
+            ]
+            self.assertEqual(list(gids), expected)
+
+    def test_gid_to_bound_array(self):
+        """Batch decoding matches the scalar decoder for mixed levels."""
+        gids = [
+            self.grid.lonlat_to_gid(lon, lat, 1 + idx % 15)
+            for idx, (lon, lat) in enumerate(
+                zip(self.longitude, self.latitude))
+        ]
+        bounds = np.column_stack(self.grid.gid_to_bound_array(gids))
+        expected = np.array([self.grid.gid_to_bound(gid) for gid in gids])
+        np.testing.assert_array_equal(bounds, expected)
+
+        lon, lat = self.grid.gid_to_lonlat_array(gids)
+        np.testing.assert_array_equal(lon, expected[:, 0])
+        np.testing.assert_array_equal(lat, expected[:, 1])
+
+    def test_gid_to_bound_array_invalid(self):
+        """Characters outside the alphabet are rejected."""
+        with self.assertRaises(ValueError):
+            self.grid.gid_to_bound_array(['J1'])
+
+
+class GeosquareGridIntTest(unittest.TestCase):
+    """Test the packed integer GID representation."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.grid = GeosquareGrid()
+        rng = np.random.default_rng(7)
+        self.gids = [
+            self.grid.lonlat_to_gid(lon, lat, 1 + idx % 15)
+            for idx, (lon, lat) in enumerate(zip(
+                rng.uniform(-180, 180, 300), rng.uniform(-90, 90, 300)))
+        ]
+
+    def test_round_trip(self):
+        """GIDs survive the integer round trip, scalar and batch."""
+        values = [self.grid.gid_to_int(gid) for gid in self.gids]
+        self.assertEqual(
+            [self.grid.int_to_gid(value) for value in values], self.gids)
+        self.assertTrue(all(value < 2 ** 64 for value in values))
+
+        packed = self.grid.gid_to_int_array(self.gids)
+        self.assertEqual(packed.dtype, np.uint64)
+        self.assertEqual(packed.tolist(), values)
+        self.assertEqual(
+            list(self.grid.int_to_gid_array(packed)), self.gids)
+
+    def test_sort_order(self):
+        """Integer order follows lexicographic GID order."""
+        values = sorted(self.grid.gid_to_int(gid) for gid in self.gids)
+        self.assertEqual(
+            [self.grid.int_to_gid(value) for value in values],
+            sorted(self.gids))
+
+    def test_invalid_gid(self):
+        """Invalid characters raise ValueError, scalar and batch."""
+        for gid in ('JY', 'J1'):
+            with self.assertRaises(ValueError):
+                self.grid.gid_to_int(gid)
+            with self.assertRaises(ValueError):
+                self.grid.gid_to_int_array([gid])
+
+    def test_hierarchy(self):
+        """Integer parent/children/level match the string operations."""
+        for gid in self.gids:
+            value = self.grid.gid_to_int(gid)
+            self.assertEqual(self.grid.int_level(value), len(gid))
+            self.assertEqual(
+                self.grid.int_to_gid(self.grid.int_to_parent(value)),
+                self.grid._to_parent(gid))
+            if len(gid) < 15:
+                self.assertEqual(
+                    [self.grid.int_to_gid(child)
+                     for child in self.grid.int_to_children(value)],
+                    list(self.grid._to_children(gid)))
+
+
+class GeosquareGridIterPolyfillTest(unittest.TestCase):
+    """Test the streaming polyfill generator."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.grid = GeosquareGrid()
+        self.geometry = QgsGeometry.fromWkt(
+            "Polygon ((106.80 -6.20, 106.95 -6.18, 106.83 -6.07, 106.80 -6.20))")
+
+    def test_matches_polyfill(self):
+        """The generator yields the polyfill result in the same order."""
+        for method in self.grid.POLYFILL_METHODS:
+            for fullcover in (True, False):
+                expected = self.grid.polyfill(
+                    self.geometry, 1000, QgsProcessingFeedback(),
+                    fullcover=fullcover, method=method)
+                result = list(self.grid.iter_polyfill(
+                    self.geometry, 1000, fullcover=fullcover, method=method))
+                self.assertEqual(result, expected)
+
+    def test_batches(self):
+        """Batches are bounded and concatenate to the polyfill result."""
+        expected = self.grid.polyfill(
+            self.geometry, [5000, 1000], QgsProcessingFeedback())
+        batches = list(self.grid.iter_polyfill(
+            self.geometry, [5000, 1000], batch_size=100))
+        self.assertTrue(all(0 < len(batch) <= 100 for batch in batches))
+        self.assertEqual(sum(batches, []), expected)
+
+    def test_parallel_matches_serial_tiles(self):
+        """Worker processes emit the cells of a serial tile by tile scanline."""
+        expected = []
+        for tile in self.grid.polyfill(self.geometry, 10000, QgsProcessingFeedback()):
+            expected.extend(self.grid.polyfill(
+                self.grid.gid_to_geometry(tile).intersection(self.geometry),
+                1000, QgsProcessingFeedback(), start=tile, method='scanline'))
+        result = self.grid.polyfill_parallel(
+            self.geometry, 1000, QgsProcessingFeedback(), workers=2)
+        self.assertEqual(result, expected)
+
+    def test_traversal_not_cached(self):
+        """Cells visited by a traversal do not fill the geometry cache."""
+        cache = GridCache()
+        grid = GeosquareGrid(cache=cache)
+        keys = grid.polyfill(self.geometry, 1000, QgsProcessingFeedback())
+        self.assertTrue(keys)
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertTrue(grid.gid_to_geometry(keys[0], cached=False).isGeosEqual(
+            grid.gid_to_geometry(keys[0])))
+
+    def test_coverage(self):
+        """Coverage of many geometries matches a polyfill of each."""
+        geometries = [
+            self.geometry,
+            QgsGeometry.fromWkt("Polygon ((106.90 -6.25, 107.00 -6.25, 107.00 -6.15, 106.90 -6.15, 106.90 -6.25))"),
+            QgsGeometry.fromWkt("Polygon EMPTY"),
+        ]
+        result = {}
+        tiles = []
+        for tile, gids, owners, fractions, inside in self.grid.iter_coverage(geometries, 1000):
+            tiles.append(tile)
+            self.assertTrue(all(gid.startswith(tile) for gid in gids))
+            self.assertEqual(list(gids), sorted(gids))
+            self.assertTrue(((fractions > 0) & (fractions <= 1)).all())
+            for gid, owner, fraction in zip(gids, owners, fractions):
+                result.setdefault(owner, {})[gid] = fraction
+        self.assertEqual(tiles, sorted(tiles))
+        self.assertNotIn(2, result)
+        for owner in (0, 1):
+            for fullcover in (True, False):
+                expected = self.grid.polyfill(
+                    geometries[owner], 1000, QgsProcessingFeedback(), fullcover=fullcover)
+                covered = [
+                    gid for gid, fraction in result[owner].items()
+                    if fullcover or fraction > 0.5]
+                self.assertEqual(sorted(covered), sorted(expected))
+
+        # cell centers inside the geometries
+        for _, gids, owners, _, inside in self.grid.iter_coverage(geometries, 1000, centers=True):
+            for gid, owner, flag in zip(gids, owners, inside):
+                xmin, ymin, xmax, ymax = self.grid.gid_to_bound(gid)
+                center = QgsGeometry.fromWkt(f"Point ({(xmin + xmax) / 2} {(ymin + ymax) / 2})")
+                self.assertEqual(flag, geometries[owner].intersects(center))
+
+
+def recursive_polyfill(grid, geometry, level, fullcover=True):
+    """Polyfill with the former recursive area ratio traversal."""
+    keys = []
+
+    def func(key, approved):
+        if approved:
+            if len(key) == level:
+                keys.append(key)
+            else:
+                for child_key in grid._to_children(key):
+                    func(child_key, True)
+            return
+        area_ratio = grid._area_ratio(
+            grid.gid_to_geometry(key, cached=False), geometry)
+        if area_ratio == 0:
+            # Walk the level 1 siblings until one overlaps the geometry
+            last_idx = grid.CODE_ALPHABET_[grid.d[0]].index(key[-1])
+            if len(key) == 1 and last_idx < 24:
+                func(grid.CODE_ALPHABET_[grid.d[0]][last_idx + 1], False)
+        elif area_ratio == 1:
+            func(key, True)
+        elif len(key) == level:
+            if fullcover or area_ratio > 0.5:
+                keys.append(key)
+        else:
+            for child_key in grid._to_children(key):
+                func(child_key, False)
+
+    func('2', False)
+    return keys
+
+
+class GeosquareGridPolyfillParityTest(unittest.TestCase):
+    """Test the polyfill engines against the former recursive traversal."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.grid = GeosquareGrid()
+        self.geometries = {
+            'triangle': QgsGeometry.fromWkt(
+                "Polygon ((106.80 -6.20, 106.95 -6.18, 106.83 -6.07, 106.80 -6.20))"),
+            'hole': QgsGeometry.fromWkt(
+                "Polygon ((106.80 -6.25, 106.98 -6.25, 106.98 -6.08, 106.80 -6.08, 106.80 -6.25),"
+                " (106.85 -6.20, 106.85 -6.12, 106.93 -6.15, 106.85 -6.20))"),
+            'multipolygon': QgsGeometry.fromWkt(
+                "MultiPolygon (((106.70 -6.30, 106.78 -6.30, 106.74 -6.22, 106.70 -6.30)),"
+                " ((106.82 -6.40, 106.97 -6.40, 106.97 -6.26, 106.82 -6.26, 106.82 -6.40),"
+                " (106.86 -6.36, 106.93 -6.36, 106.93 -6.30, 106.86 -6.30, 106.86 -6.36)))"),
+        }
+
+    def test_same_cells(self):
+        """Prepared predicates and area ratios find the cells of the recursion."""
+        for name, geometry in self.geometries.items():
+            for fullcover in (True, False):
+                expected = recursive_polyfill(self.grid, geometry, 9, fullcover)
+                self.assertTrue(expected, name)
+                for method in ('prepared', 'area'):
+                    result = self.grid.polyfill(
+                        geometry, 1000, QgsProcessingFeedback(),
+                        fullcover=fullcover, method=method)
+                    self.assertEqual(
+                        sorted(result), sorted(expected),
+                        f"{name}, {method}, fullcover={fullcover}")
+
+
+    def test_same_order(self):
+        """The level by level traversal emits cells in the recursion order."""
+        for name, geometry in self.geometries.items():
+            for fullcover in (True, False):
+                expected = recursive_polyfill(self.grid, geometry, 9, fullcover)
+                result = list(self.grid.iter_polyfill(
+                    geometry, 1000, fullcover=fullcover, batch_size=64))
+                self.assertEqual(sum(result, []), expected, name)
+
+    def test_progress_per_level(self):
+        """Progress text is reported once per level, not once per batch."""
+        messages = []
+
+        class Feedback(QgsProcessingFeedback):
+            def setProgressText(self, text):
+                messages.append(text)
+
+        list(self.grid.iter_polyfill(
+            self.geometries['hole'], 1000, Feedback(), batch_size=16))
+        levels = [message.split(':')[0] for message in messages]
+        self.assertTrue(levels)
+        self.assertEqual(len(levels), len(set(levels)))
+
+
+class GeosquareGridDescendantsTest(unittest.TestCase):
+    """Test descendant enumeration of a parent cell."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.grid = GeosquareGrid()
+        self.geometry = QgsGeometry.fromWkt(
+            "Polygon ((106.80 -6.20, 106.95 -6.18, 106.83 -6.07, 106.80 -6.20))")
+
+    def test_all_children(self):
+        """Descendants and bounds follow child expansion in GID order."""
+        expected = ['J3N2M2Q']
+        while len(expected[0]) < 9:
+            expected = [
+                child for key in expected for child in self.grid._to_children(key)]
+        self.assertEqual(
+            self.grid.parrent_to_allchildren('J3N2M2Q', 1000), expected)
+        gids, bounds = self.grid.gid_to_descendants_array('J3N2M2Q', 1000)
+        np.testing.assert_array_equal(
+            np.column_stack(bounds),
+            np.array([self.grid.gid_to_bound(gid) for gid in expected]))
+        with self.assertRaises(ValueError):
+            self.grid.parrent_to_allchildren('J3N2M2Q', 10000000)
+
+    def test_geometry_filter(self):
+        """Only descendants overlapping the geometry are kept."""
+        counts = []
+        for key in ('J3N2M2Q', 'J3N2M8277', 'J3N2M827', 'J3N2M83'):
+            expected = [
+                gid for gid in self.grid.parrent_to_allchildren(key, 500)
+                if self.grid._area_ratio(
+                    self.grid.gid_to_geometry(gid), self.geometry) > 0
+            ]
+            self.assertEqual(
+                self.grid.parrent_to_allchildren(key, 500, self.geometry),
+                expected)
+            counts.append(len(expected))
+        # Disjoint, contained and partially covered parents
+        self.assertEqual(counts[:2], [0, 4])
+        self.assertTrue(0 < counts[2] < 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
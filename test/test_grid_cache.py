@@ -0,0 +1,69 @@
+# coding=utf-8
+"""Grid cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'admin@geosquare.ai'
+__date__ = '2025-04-17'
+__copyright__ = 'Copyright 2025, PT Geo Inovasi Nusantara'
+
+import unittest
+
+from tools.grid_cache import GridCache
+
+
+class GridCacheTest(unittest.TestCase):
+    """Test the bounded, instrumented grid cache."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.cache = GridCache(capacity=2, level_capacity={1: 1})
+
+    def test_hits_and_misses(self):
+        """Repeated lookups are served from the cache."""
+        calls = []
+        for _ in range(3):
+            value = self.cache.get_or_compute(
+                'bound', 12, 'J3', lambda: calls.append(1) or 'value')
+            self.assertEqual(value, 'value')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_lru_eviction(self):
+        """The least recently used entry of a partition is evicted."""
+        self.cache.get_or_compute('bound', 12, 'a', lambda: 1)
+        self.cache.get_or_compute('bound', 12, 'b', lambda: 2)
+        self.cache.get_or_compute('bound', 12, 'a', lambda: 1)
+        self.cache.get_or_compute('bound', 12, 'c', lambda: 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(
+            self.cache.get_or_compute('bound', 12, 'a', lambda: None), 1)
+        self.assertIsNone(
+            self.cache.get_or_compute('bound', 12, 'b', lambda: None))
+
+    def test_level_capacity(self):
+        """Partitions are bounded per level and per namespace."""
+        self.cache.get_or_compute('bound', 1, '2', lambda: 1)
+        self.cache.get_or_compute('bound', 1, '3', lambda: 2)
+        self.cache.get_or_compute('geometry', 1, '2', lambda: 3)
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.cache.set_capacity(0, level=1)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_clear(self):
+        """Clearing drops entries and resets counters."""
+        self.cache.get_or_compute('bound', 12, 'a', lambda: 1)
+        self.cache.clear()
+        self.assertEqual(
+            self.cache.stats(),
+            {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
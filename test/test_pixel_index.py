@@ -0,0 +1,65 @@
+# coding=utf-8
+"""Pixel index store test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'admin@geosquare.ai'
+__date__ = '2025-04-17'
+__copyright__ = 'Copyright 2025, PT Geo Inovasi Nusantara'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tools.pixel_index import PixelIndexStore, index_key
+
+
+class PixelIndexStoreTest(unittest.TestCase):
+    """Test the on-disk pixel to cell index."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_index_key(self):
+        """Keys depend on every part."""
+        grid = ((100.0, -1.0, 100.3, -0.7), (300, 240))
+        self.assertEqual(index_key(*grid, 11), index_key(*grid, 11))
+        self.assertNotEqual(index_key(*grid, 11), index_key(*grid, 12))
+
+    def test_round_trip(self):
+        """Stored indexes load back, with pixel arrays memory mapped."""
+        store = PixelIndexStore(self.directory, index_key('grid'))
+        self.assertIsNone(store.load('J3N2M82'))
+        store.save('J3N2M82', ['J3N2M8200', 'J3N2M8201'], np.array([0, 1, 5]), np.array([0, 0, 1]))
+        cells, pixels, groups, weights = store.load('J3N2M82')
+        self.assertEqual(cells.tolist(), ['J3N2M8200', 'J3N2M8201'])
+        self.assertIsInstance(pixels, np.memmap)
+        self.assertEqual(pixels.dtype, np.int32)
+        self.assertEqual(groups.tolist(), [0, 0, 1])
+        self.assertIsNone(weights)
+        # aggregating a raster is a gather and a bincount
+        values = np.arange(6, dtype=np.float64).reshape(2, 3)
+        self.assertEqual(np.bincount(groups, weights=values.ravel()[pixels]).tolist(), [1.0, 5.0])
+
+        store.save('J3N2M83', [], np.empty(0), np.empty(0), np.empty(0))
+        cells, _, _, weights = store.load('J3N2M83')
+        self.assertEqual(len(cells), 0)
+        self.assertEqual(len(weights), 0)
+        self.assertFalse([name for name in os.listdir(store.directory) if name.endswith('.tmp')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+# coding=utf-8
+"""Worker process pool test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'admin@geosquare.ai'
+__date__ = '2025-04-17'
+__copyright__ = 'Copyright 2025, PT Geo Inovasi Nusantara'
+
+import unittest
+
+import numpy as np
+
+from tools import geosquare_core, process_pool
+
+
+class ProcessPoolTest(unittest.TestCase):
+    """Test running the QGIS-free core in worker processes."""
+
+    def test_polyfill_tile_in_workers(self):
+        """Workers return the same tiles as the in-process core."""
+        polygons = [[np.array([
+            (106.80, -6.20), (106.95, -6.18), (106.83, -6.07), (106.80, -6.20)
+        ])]]
+        tiles = ['J3N2M82', 'J3N2M83', 'J3N2M2Q']
+        core = process_pool.load_core()
+        with process_pool.create_pool(2) as pool:
+            results = list(pool.map(
+                core.polyfill_tile, tiles, [polygons] * 3, [11] * 3))
+        self.assertEqual([len(result) > 0 for result in results], [True, True, False])
+        for tile, result in zip(tiles, results):
+            np.testing.assert_array_equal(
+                result, geosquare_core.polyfill_tile(tile, polygons, 11))
+
+
+if __name__ == "__main__":
+    unittest.main()
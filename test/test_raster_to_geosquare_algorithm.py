@@ -0,0 +1,270 @@
+# coding=utf-8
+"""From raster algorithm end to end test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'admin@geosquare.ai'
+__date__ = '2025-04-17'
+__copyright__ = 'Copyright 2025, PT Geo Inovasi Nusantara'
+
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+
+import numpy as np
+
+try:
+    from osgeo import gdal, osr
+    from qgis.analysis import QgsNativeAlgorithms
+    from qgis.core import (
+        QgsApplication,
+        QgsFeature,
+        QgsGeometry,
+        QgsProcessingContext,
+        QgsProcessingFeedback,
+        QgsProcessingUtils,
+        QgsRasterLayer,
+        QgsVectorLayer)
+    from .utilities import get_qgis_app
+    QGIS_APP = get_qgis_app()[0]
+except ImportError:
+    QGIS_APP = None
+
+from tools import geosquare_core
+
+if QGIS_APP is not None:
+    import processing
+    from processing.core.Processing import Processing
+    from tools.raster_to_geosquare_algorithm import FromRasterAlgorithm
+    QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
+    Processing.initialize()
+
+NODATA = -9999
+# 1 km cells, 100 m pixels
+LEVEL = 9
+GEOTRANSFORM = (106.78, 0.001, 0, -6.08, 0, -0.001)
+
+
+def write_raster(path, arrays, geotransform, epsg):
+    """Write float32 bands to a GeoTIFF, NODATA is nodata."""
+    height, width = arrays[0].shape
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        path, width, height, len(arrays), gdal.GDT_Float32)
+    dataset.SetGeoTransform(geotransform)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    dataset.SetProjection(srs.ExportToWkt())
+    for idx, array in enumerate(arrays, 1):
+        band = dataset.GetRasterBand(idx)
+        band.SetNoDataValue(NODATA)
+        band.WriteArray(array)
+    dataset = None
+
+
+def pixel_cells(path):
+    """GID of the cell containing every pixel center of a raster and its bands."""
+    dataset = gdal.Open(path)
+    geotransform = dataset.GetGeoTransform()
+    columns, rows = np.meshgrid(
+        np.arange(dataset.RasterXSize) + 0.5, np.arange(dataset.RasterYSize) + 0.5)
+    x = geotransform[0] + columns * geotransform[1]
+    y = geotransform[3] + rows * geotransform[5]
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(dataset.GetProjection())
+    if not srs.IsGeographic():
+        target = osr.SpatialReference()
+        target.ImportFromEPSG(4326)
+        for reference in (srs, target):
+            reference.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        points = np.array(osr.CoordinateTransformation(srs, target).TransformPoints(
+            np.column_stack((x.ravel(), y.ravel())).tolist()))
+        x, y = points[:, 0].reshape(x.shape), points[:, 1].reshape(y.shape)
+    gids = geosquare_core.index_to_gid_array(
+        *geosquare_core.lonlat_to_index_array(x, y, LEVEL), LEVEL)
+    bands = [
+        dataset.GetRasterBand(idx).ReadAsArray().astype(np.float64)
+        for idx in range(1, dataset.RasterCount + 1)
+    ]
+    return gids, bands
+
+
+@unittest.skipIf(QGIS_APP is None, 'QGIS and GDAL are required')
+class FromRasterAlgorithmTest(unittest.TestCase):
+    """Run the raster algorithm on a small in-memory GeoTIFF."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(11)
+        first = rng.uniform(0, 100, (140, 140)).astype(np.float32)
+        second = rng.normal(50, 10, (140, 140)).astype(np.float32)
+        second[rng.random((140, 140)) < 0.2] = NODATA
+        self.path = f'/vsimem/geosquare_{uuid.uuid4().hex}.tif'
+        write_raster(self.path, [first, second], GEOTRANSFORM, 4326)
+        self.raster = QgsRasterLayer(self.path, 'raster', 'gdal')
+        self.boundary = QgsVectorLayer('Polygon?crs=EPSG:4326', 'boundary', 'memory')
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromWkt(
+            "Polygon ((106.80 -6.20, 106.90 -6.19, 106.88 -6.10, 106.81 -6.12, 106.80 -6.20))"))
+        self.boundary.dataProvider().addFeatures([feature])
+        self.boundary.updateExtents()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.raster = None
+        gdal.Unlink(self.path)
+        shutil.rmtree(self.directory)
+
+    def run_algorithm(self, raster, **parameters):
+        """Statistics of the output cells by GID, with the output layer."""
+        values = {
+            'INPUT': raster,
+            'BOUNDARY': self.boundary,
+            'BAND': 1,
+            'BANDS': [1, 2],
+            'CALCULATETYPE': [1, 6],
+            'PERCENTILES': '',
+            'GRIDSIZE': 3,
+            'REPROJECTION': 0,
+            'WORKERS': 3,
+            'SKIPNODATA': False,
+            'WEIGHTED': False,
+            'QUANTILEBINS': 0,
+            'OUTPUT': 'memory:',
+        }
+        values.update(parameters)
+        context = QgsProcessingContext()
+        results = processing.run(
+            FromRasterAlgorithm().create(), values, context=context, feedback=QgsProcessingFeedback())
+        layer = results['OUTPUT']
+        if not isinstance(layer, QgsVectorLayer):
+            layer = QgsProcessingUtils.mapLayerFromString(layer, context)
+        names = layer.fields().names()
+        cells = {
+            feature['gid']: dict(zip(names, feature.attributes()))
+            for feature in layer.getFeatures()
+        }
+        return cells, layer
+
+    def assert_matches_pixels(self, cells, path):
+        """Mean and count of every cell match its pixels found by brute force."""
+        gids, bands = pixel_cells(path)
+        self.assertTrue(cells)
+        for gid, row in cells.items():
+            for band, values in enumerate(bands, 1):
+                selected = values[(gids == gid) & (values != NODATA)]
+                self.assertEqual(row[f'b{band}_count'], len(selected), gid)
+                if len(selected):
+                    self.assertAlmostEqual(row[f'b{band}_mean'], selected.mean(), places=4)
+                else:
+                    self.assertFalse(row[f'b{band}_mean'])
+
+    def test_multi_band(self):
+        """Every band gets its columns from one pass over the tiles."""
+        cells, _ = self.run_algorithm(self.raster)
+        self.assert_matches_pixels(cells, self.path)
+
+    def test_matches_zonal_statistics(self):
+        """Cells match native zonal statistics, as the former clip path did."""
+        cells, layer = self.run_algorithm(self.raster)
+        for band in (1, 2):
+            zonal = processing.run('native:zonalstatisticsfb', {
+                'INPUT': layer,
+                'INPUT_RASTER': self.raster,
+                'RASTER_BAND': band,
+                'COLUMN_PREFIX': '_',
+                'STATISTICS': [0, 2],
+                'OUTPUT': 'memory:',
+            })['OUTPUT']
+            for feature in zonal.getFeatures():
+                row = cells[feature['gid']]
+                self.assertEqual(row[f'b{band}_count'], feature['_count'])
+                if feature['_count']:
+                    self.assertAlmostEqual(row[f'b{band}_mean'], feature['_mean'], places=4)
+
+    def test_pixels_larger_than_cells(self):
+        """Cells holding at most one pixel center match native zonal statistics."""
+        path = f'/vsimem/geosquare_{uuid.uuid4().hex}.tif'
+        dataset = gdal.Warp(path, self.path, dstSRS='EPSG:3857', xRes=100, yRes=100)
+        dataset = None
+        projected = QgsRasterLayer(path, 'projected', 'gdal')
+        try:
+            # 111 m pixels in EPSG:4326 and 100 m pixels reprojected per tile,
+            # with 50 m cells
+            for raster in (self.raster, projected):
+                cells, layer = self.run_algorithm(raster, GRIDSIZE=0, CALCULATETYPE=[0, 1, 6])
+                for band in (1, 2):
+                    zonal = processing.run('native:zonalstatisticsfb', {
+                        'INPUT': layer,
+                        'INPUT_RASTER': raster,
+                        'RASTER_BAND': band,
+                        'COLUMN_PREFIX': '_',
+                        'STATISTICS': [0, 1, 2],
+                        'OUTPUT': 'memory:',
+                    })['OUTPUT']
+                    for feature in zonal.getFeatures():
+                        row = cells[feature['gid']]
+                        self.assertEqual(bool(row[f'b{band}_count']), bool(feature['_count']), feature['gid'])
+                        if feature['_count']:
+                            self.assertAlmostEqual(row[f'b{band}_sum'], feature['_sum'], places=3)
+                            self.assertAlmostEqual(row[f'b{band}_mean'], feature['_mean'], places=4)
+        finally:
+            projected = None
+            gdal.Unlink(path)
+
+    def test_worker_threads(self):
+        """The output does not depend on the number of worker threads."""
+        single, _ = self.run_algorithm(self.raster, WORKERS=1)
+        threaded, _ = self.run_algorithm(self.raster, WORKERS=4)
+        self.assertEqual(list(single.items()), list(threaded.items()))
+
+    def test_reprojection_per_tile(self):
+        """Pixels of a projected raster are assigned by their reprojected centers."""
+        path = f'/vsimem/geosquare_{uuid.uuid4().hex}.tif'
+        dataset = gdal.Warp(path, self.path, dstSRS='EPSG:3857', xRes=100, yRes=100)
+        dataset = None
+        raster = QgsRasterLayer(path, 'projected', 'gdal')
+        try:
+            cells, _ = self.run_algorithm(raster, REPROJECTION=0)
+            self.assert_matches_pixels(cells, path)
+        finally:
+            raster = None
+            gdal.Unlink(path)
+
+    def test_index_cache(self):
+        """Rasters on the same grid reuse the stored pixel index."""
+        expected, _ = self.run_algorithm(self.raster)
+        cached, _ = self.run_algorithm(self.raster, INDEXCACHE=self.directory)
+        self.assertEqual(cached, expected)
+        stored = [name for _, _, names in os.walk(self.directory) for name in names]
+        self.assertTrue(any(name.endswith('.groups.npy') for name in stored))
+
+        # another raster on the same grid is read through the stored index
+        path = f'/vsimem/geosquare_{uuid.uuid4().hex}.tif'
+        dataset = gdal.Open(self.path)
+        bands = [
+            np.where(array == NODATA, NODATA, array * 2).astype(np.float32)
+            for array in (dataset.GetRasterBand(idx).ReadAsArray() for idx in (1, 2))
+        ]
+        dataset = None
+        write_raster(path, bands, GEOTRANSFORM, 4326)
+        raster = QgsRasterLayer(path, 'doubled', 'gdal')
+        try:
+            reused, _ = self.run_algorithm(raster, INDEXCACHE=self.directory)
+            fresh, _ = self.run_algorithm(raster)
+            self.assertEqual(reused, fresh)
+            self.assert_matches_pixels(reused, path)
+        finally:
+            raster = None
+            gdal.Unlink(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,272 @@
+# coding=utf-8
+"""Zonal statistics core test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'admin@geosquare.ai'
+__date__ = '2025-04-17'
+__copyright__ = 'Copyright 2025, PT Geo Inovasi Nusantara'
+
+import unittest
+
+import numpy as np
+
+from tools import geosquare_core, zonal_core
+
+
+class ZonalCoreTest(unittest.TestCase):
+    """Test pixel to cell assignment and grouped statistics."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.raster_bounds = (106.7, -6.3, 107.0, -6.0)
+        self.raster_size = (300, 240)
+
+    def test_pixel_window(self):
+        """The window covers every pixel center inside the bounds."""
+        bounds = geosquare_core.index_to_bound(
+            *geosquare_core.gid_to_index('J3N2M82'), 7)
+        window = zonal_core.pixel_window(self.raster_bounds, self.raster_size, bounds)
+        x_all, y_all = zonal_core.pixel_centers(
+            self.raster_bounds, self.raster_size, (0, 0) + self.raster_size)
+        x_centers, y_centers = zonal_core.pixel_centers(
+            self.raster_bounds, self.raster_size, window)
+        inside_x = x_all[(x_all >= bounds[0]) & (x_all < bounds[2])]
+        inside_y = y_all[(y_all >= bounds[1]) & (y_all < bounds[3])]
+        self.assertTrue(set(inside_x) <= set(x_centers))
+        self.assertTrue(set(inside_y) <= set(y_centers))
+        # Bounds outside the raster give an empty window
+        window = zonal_core.pixel_window(self.raster_bounds, self.raster_size, (0, 0, 1, 1))
+        self.assertTrue(window[2] <= window[0] and window[3] <= window[1])
+
+    def test_cell_slots(self):
+        """Pixels get the cell containing their center."""
+        level = 9
+        window = geosquare_core.cell_window('J3N2M82', level)
+        x_centers, y_centers = zonal_core.pixel_centers(
+            self.raster_bounds, self.raster_size, (0, 0) + self.raster_size)
+        slots = zonal_core.cell_slots(x_centers[None, :], y_centers[:, None], level, window)
+        self.assertEqual(slots.shape, (240, 300))
+        for row in range(0, 240, 7):
+            for col in range(0, 300, 11):
+                column, cell_row = geosquare_core.lonlat_to_index(
+                    x_centers[col], y_centers[row], level)
+                if window[0] <= column < window[2] and window[1] <= cell_row < window[3]:
+                    expected = (cell_row - window[1]) * (window[2] - window[0]) + column - window[0]
+                else:
+                    expected = -1
+                self.assertEqual(slots[row, col], expected)
+
+        # Unprojectable pixels are outside every window
+        self.assertEqual(
+            zonal_core.cell_slots(np.array([np.inf, np.nan]), np.array([-6.2, -6.2]), level, window).tolist(),
+            [-1, -1])
+
+    def test_axis_overlaps(self):
+        """Overlap fractions split each pixel between the cells it spans."""
+        pixel, cell, fraction = zonal_core.axis_overlaps(
+            np.array([0.0, 0.25, 0.5, 1.5]), 0.0, 0.4)
+        self.assertEqual(pixel.tolist(), [0, 1, 2, 1, 2, 2])
+        self.assertEqual(cell.tolist(), [0, 0, 1, 1, 2, 3])
+        np.testing.assert_allclose(
+            fraction, [1, 0.6, 0.3, 0.4, 0.4, 0.3])
+
+    def test_pixel_cell_weights(self):
+        """Pixel weights add up to one and cell areas to the covered pixels."""
+        level = 12
+        window = geosquare_core.cell_window('J3N2M82', level)
+        x_edges, y_edges = zonal_core.pixel_edges(
+            self.raster_bounds, self.raster_size, (0, 0) + self.raster_size)
+        rows, columns, slots, weights = zonal_core.pixel_cell_weights(
+            x_edges, y_edges, level, window)
+        self.assertTrue((slots >= 0).all())
+        self.assertTrue((weights > 0).all())
+        totals = np.bincount(rows * 300 + columns, weights=weights, minlength=300 * 240)
+        # Pixels inside the tile are split completely between its cells
+        x_window = zonal_core.pixel_window(
+            self.raster_bounds, self.raster_size,
+            geosquare_core.index_to_bound(*geosquare_core.gid_to_index('J3N2M82'), 7))
+        inner = totals.reshape(240, 300)[x_window[1] + 1:x_window[3] - 1, x_window[0] + 1:x_window[2] - 1]
+        np.testing.assert_allclose(inner, 1)
+        # A cell is covered by pixel area equal to its own area
+        pixel_area = (0.3 / 300) * (0.3 / 240)
+        cell_area = np.bincount(slots, weights=weights) * pixel_area
+        interior = (window[2] - window[0]) * 2 + 2
+        np.testing.assert_allclose(
+            cell_area[interior], geosquare_core.CELL_SIZE[level] ** 2)
+
+    def test_rect_pixel_weights(self):
+        """Rectangles of cells get the weights of pixel_cell_weights."""
+        level = 12
+        window = geosquare_core.cell_window('J3N2M82', level)
+        x_edges, y_edges = zonal_core.pixel_edges(
+            self.raster_bounds, self.raster_size, (0, 0) + self.raster_size)
+        rows, columns, slots, weights = zonal_core.pixel_cell_weights(
+            x_edges, y_edges, level, window)
+        width = window[2] - window[0]
+        cells = np.arange(width * (window[3] - window[1]))
+        rects = np.column_stack(geosquare_core.index_to_bound_array(
+            window[0] + cells % width, window[1] + cells // width, level))
+        rect, pixels, rect_weights = zonal_core.rect_pixel_weights(
+            self.raster_bounds, self.raster_size, (0, 0) + self.raster_size, rects)
+        expected = np.lexsort((rows * 300 + columns, slots))
+        found = np.lexsort((pixels, rect))
+        np.testing.assert_array_equal(rect[found], slots[expected])
+        np.testing.assert_array_equal(pixels[found], (rows * 300 + columns)[expected])
+        np.testing.assert_allclose(rect_weights[found], weights[expected])
+
+        # Pixels are limited to the window, rows from its top
+        rect, pixels, rect_weights = zonal_core.rect_pixel_weights(
+            (0, 0, 10, 10), (10, 10), (2, 3, 6, 8), np.array([[1.5, 4.5, 4.0, 7.5], [20, 20, 30, 30]]))
+        self.assertEqual(rect.tolist(), [0] * 6)
+        self.assertEqual(pixels.tolist(), [0, 1, 4, 5, 8, 9])
+        np.testing.assert_allclose(rect_weights, [1, 1, 1, 1, 0.5, 0.5])
+
+    def test_weighted_statistics(self):
+        """Weights apply to sum, mean and stdev."""
+        groups = np.array([0, 0, 0, 1])
+        values = np.array([1.0, 3.0, np.nan, 5.0])
+        weights = np.array([0.25, 0.75, 1.0, 0.5])
+        result = zonal_core.grouped_statistics(
+            groups, values, 2, ['sum', 'mean', 'stdev', 'count', 'max'], weights=weights)
+        np.testing.assert_allclose(result['sum'], [2.5, 2.5])
+        np.testing.assert_allclose(result['mean'], [2.5, 5.0])
+        np.testing.assert_allclose(result['stdev'], [np.sqrt(0.75), 0])
+        self.assertEqual(result['count'].tolist(), [2, 1])
+        self.assertEqual(result['max'].tolist(), [3.0, 5.0])
+
+    def test_grouped_statistics(self):
+        """Grouped reductions match per-group numpy statistics."""
+        rng = np.random.default_rng(3)
+        groups = rng.integers(0, 40, 2000)
+        groups[groups == 7] = 8
+        values = rng.normal(10, 3, 2000)
+        values[rng.random(2000) < 0.1] = np.nan
+        values[groups == 9] = np.nan
+        result = zonal_core.grouped_statistics(
+            groups, values, 41, zonal_core.STATISTICS, [10, 92.5])
+        for group in range(41):
+            selected = values[groups == group]
+            self.assertEqual(result['nodata'][group], np.isnan(selected).sum())
+            selected = selected[~np.isnan(selected)]
+            self.assertEqual(result['count'][group], len(selected))
+            if len(selected) == 0:
+                self.assertEqual(result['sum'][group], 0)
+                for statistic in ('mean', 'median', 'stdev', 'min', 'max', 10, 92.5):
+                    self.assertTrue(np.isnan(result[statistic][group]))
+                continue
+            self.assertAlmostEqual(result['sum'][group], selected.sum())
+            self.assertAlmostEqual(result['mean'][group], selected.mean())
+            self.assertAlmostEqual(result['median'][group], np.median(selected))
+            self.assertAlmostEqual(result['stdev'][group], selected.std())
+            self.assertEqual(result['min'][group], selected.min())
+            self.assertEqual(result['max'][group], selected.max())
+            self.assertAlmostEqual(result[10][group], np.percentile(selected, 10))
+            self.assertAlmostEqual(result[92.5][group], np.percentile(selected, 92.5))
+
+        empty = zonal_core.grouped_statistics([], [], 3, zonal_core.STATISTICS)
+        self.assertTrue(np.isnan(empty['median']).all())
+        self.assertEqual(empty['count'].tolist(), [0, 0, 0])
+
+    def test_histogram_quantiles(self):
+        """Histogram percentiles are within one bin of the exact ones."""
+        rng = np.random.default_rng(5)
+        groups = rng.integers(0, 30, 20000)
+        values = rng.normal(10, 3, 20000)
+        values[rng.random(20000) < 0.1] = np.nan
+        exact = zonal_core.grouped_statistics(groups, values, 32, ['median', 'min', 'max'], [10, 92.5])
+        lower, upper = np.nanmin(values), np.nanmax(values)
+        approximate = zonal_core.grouped_statistics(
+            groups, values, 32, ['median', 'min', 'max'], [10, 92.5], histogram=(lower, upper, 256))
+        for key in ('median', 10, 92.5):
+            np.testing.assert_allclose(approximate[key][:30], exact[key][:30], atol=(upper - lower) / 256)
+        self.assertEqual(approximate['min'][:30].tolist(), exact['min'][:30].tolist())
+        self.assertEqual(approximate['max'][:30].tolist(), exact['max'][:30].tolist())
+        self.assertTrue(np.isnan(approximate['median'][30:]).all())
+
+    def test_histogram_merge(self):
+        """Histograms of parts merge into the histogram of the whole."""
+        rng = np.random.default_rng(6)
+        groups = rng.integers(0, 5, 5000) * 1000
+        values = rng.uniform(0, 20, 5000)
+        whole = zonal_core.GroupedHistogram(0, 10, 64)
+        whole.add(groups, values)
+        first = zonal_core.GroupedHistogram(0, 10, 64)
+        first.add(groups[:2000], values[:2000])
+        second = zonal_core.GroupedHistogram(0, 10, 64)
+        second.add(groups[2000:], values[2000:])
+        first.merge(second)
+        self.assertEqual(first.keys.tolist(), whole.keys.tolist())
+        self.assertEqual(first.counts.tolist(), whole.counts.tolist())
+        self.assertEqual(first.maximum.tolist(), whole.maximum.tolist())
+        query = np.array([0, 1000, 7000])
+        merged = first.quantiles(query, [0, 50, 100])
+        self.assertEqual(merged[100][1], values[groups == 1000].max())
+        self.assertTrue(np.isnan(merged[50][2]))
+        with self.assertRaises(ValueError):
+            first.merge(zonal_core.GroupedHistogram(0, 10, 32))
+
+    def test_streamed_statistics(self):
+        """Statistics added in parts match the statistics of the whole."""
+        rng = np.random.default_rng(8)
+        groups = rng.integers(0, 40, 30000)
+        values = rng.gamma(2, 5, 30000)
+        values[rng.random(30000) < 0.1] = np.nan
+        weights = rng.uniform(0.1, 1, 30000)
+        histogram = (0, np.nanmax(values), 128)
+        for part_weights in (None, weights):
+            expected = zonal_core.grouped_statistics(
+                groups, values, 42, zonal_core.STATISTICS, [10, 92.5],
+                part_weights, histogram)
+            streamed = zonal_core.GroupedStatistics(42, histogram)
+            other = zonal_core.GroupedStatistics(42, histogram)
+            for start in range(0, 30000, 7000):
+                part = slice(start, start + 7000)
+                target = streamed if start < 14000 else other
+                target.add(groups[part], values[part],
+                           None if part_weights is None else part_weights[part])
+            streamed.merge(other)
+            result = streamed.result(zonal_core.STATISTICS, [10, 92.5])
+            for key, value in expected.items():
+                np.testing.assert_allclose(result[key], value, rtol=1e-9, err_msg=str(key))
+            self.assertTrue(np.isnan(result['stdev'][40:]).all())
+
+    def test_apportion(self):
+        """Extensive attributes are split by area share, intensive ones averaged."""
+        # polygon 0 covers cell 0 and half of cell 1, polygon 1 the other half
+        groups = np.array([0, 1, 1])
+        owners = np.array([0, 0, 1])
+        fractions = np.array([1.0, 0.5, 0.5])
+        values = np.array([[30.0, 2.0], [10.0, np.nan]])
+        areas = np.array([1.5, 0.5])
+        result = zonal_core.apportion(groups, 3, owners, fractions, values, areas, [True, False])
+        np.testing.assert_allclose(result[:2, 0], [20.0, 10.0 + 10.0])
+        np.testing.assert_allclose(result[:2, 1], [2.0, 2.0])
+        self.assertTrue(np.isnan(result[2]).all())
+        # totals of extensive attributes are preserved
+        self.assertAlmostEqual(np.nansum(result[:, 0]), 40.0)
+
+    def test_assign_cells(self):
+        """Policies keep one polygon per cell, except majority."""
+        groups = np.array(['a', 'a', 'b', 'b', 'c'])
+        owners = np.array([0, 1, 0, 2, 2])
+        fractions = np.array([0.4, 0.6, 0.3, 0.3, 0.2])
+        self.assertEqual(zonal_core.assign_cells(groups, owners, fractions, 'majority').tolist(), [1])
+        self.assertEqual(zonal_core.assign_cells(groups, owners, fractions, 'largest').tolist(), [1, 2, 4])
+        centers = np.array([True, False, False, True, False])
+        self.assertEqual(
+            zonal_core.assign_cells(groups, owners, fractions, 'center', centers).tolist(), [0, 3])
+        priorities = np.array([2.0, 1.0, np.nan])
+        self.assertEqual(
+            zonal_core.assign_cells(groups, owners, fractions, 'priority', priorities=priorities).tolist(), [1, 2, 4])
+        with self.assertRaises(ValueError):
+            zonal_core.assign_cells(groups, owners, fractions, 'random')
+
+
+if __name__ == "__main__":
+    unittest.main()
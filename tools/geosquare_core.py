@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ GeosquareGrid
+                                 A QGIS plugin
+ Geosquare Grid
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2025-04-17
+        copyright            : (C) 2025 by PT Geo Innovasi Nussantara
+        email                : admin@geosquare.ai
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Arithmetic core of the Geosquare grid. This module must not import QGIS so
+that it can run in worker processes.
+"""
+
+__author__ = 'PT Geo Innovasi Nussantara'
+__date__ = '2025-04-17'
+__copyright__ = '(C) 2025 by PT Geo Innovasi Nussantara'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+CODE_ALPHABET = [
+    ["2", "3", "4", "5", "6"],
+    ["7", "8", "9", "C", "E"],
+    ["F", "G", "H", "J", "L"],
+    ["M", "N", "P", "Q", "R"],
+    ["T", "V", "W", "X", "Y"],
+]
+LEVEL_PARTS = [5, 2, 5, 2, 5, 2, 5, 2, 5, 2, 5, 2, 5, 2, 5]
+MAX_LEVEL = len(LEVEL_PARTS)
+
+# The grid is a square of EXTENT degrees anchored at (LON_ORIGIN, LAT_ORIGIN)
+LON_ORIGIN = -217.0
+LAT_ORIGIN = -216.0
+EXTENT = 449.157642055036
+
+# Number of cells along one axis at each level (index 0 is the whole grid)
+CELLS_PER_AXIS = [1]
+for _part in LEVEL_PARTS:
+    CELLS_PER_AXIS.append(CELLS_PER_AXIS[-1] * _part)
+
+# Cell edge length in degrees at each level
+CELL_SIZE = [EXTENT / cells for cells in CELLS_PER_AXIS]
+
+# Level-15 cells per degree: coordinates are scaled once by this factor
+INDEX_SCALE = CELLS_PER_AXIS[MAX_LEVEL] / EXTENT
+
+# Lookup between characters and their (row digit, column digit)
+CODE_VALUE = {
+    char: (idx_y, idx_x)
+    for idx_y, row in enumerate(CODE_ALPHABET)
+    for idx_x, char in enumerate(row)
+}
+
+# Lookup tables between (row digit, column digit) and ASCII codes
+ALPHABET_CODES = np.array(
+    [[ord(char) for char in row] for row in CODE_ALPHABET], dtype=np.uint8
+)
+CODE_VALUE_Y = np.full(256, -1, dtype=np.intp)
+CODE_VALUE_X = np.full(256, -1, dtype=np.intp)
+for _idx_y, _row in enumerate(CODE_ALPHABET):
+    for _idx_x, _char in enumerate(_row):
+        CODE_VALUE_Y[ord(_char)] = _idx_y
+        CODE_VALUE_X[ord(_char)] = _idx_x
+
+
+def level_factor(level: int, finer_level: int = MAX_LEVEL) -> int:
+    """Number of finer_level cells along one axis of a level cell"""
+    return CELLS_PER_AXIS[finer_level] // CELLS_PER_AXIS[level]
+
+
+# === Scalar codec ===
+
+def lonlat_to_index(longitude: float, latitude: float, level: int) -> Tuple[int, int]:
+    """Convert longitude/latitude to the (column, row) index of a cell at level"""
+    factor = level_factor(level)
+    column = math.floor((longitude - LON_ORIGIN) * INDEX_SCALE) // factor
+    row = math.floor((latitude - LAT_ORIGIN) * INDEX_SCALE) // factor
+    return column, row
+
+
+def index_to_gid(column: int, row: int, level: int) -> str:
+    """Convert the (column, row) index of a cell at level to GID"""
+    chars = []
+    for part in reversed(LEVEL_PARTS[:level]):
+        column, digit_x = divmod(column, part)
+        row, digit_y = divmod(row, part)
+        chars.append(CODE_ALPHABET[digit_y][digit_x])
+    return "".join(reversed(chars))
+
+
+def gid_to_index(gid: str) -> Tuple[int, int]:
+    """Convert GID to the (column, row) index of the cell at its level"""
+    if len(gid) > MAX_LEVEL:
+        raise ValueError(f"GID must be at most {MAX_LEVEL} characters long")
+    column = 0
+    row = 0
+    try:
+        for part, char in zip(LEVEL_PARTS, gid):
+            value_y, value_x = CODE_VALUE[char]
+            if value_x >= part or value_y >= part:
+                raise ValueError(f"GID contains characters outside the alphabet of their level: {gid}")
+            column = column * part + value_x
+            row = row * part + value_y
+    except KeyError:
+        raise ValueError(f"GID contains characters outside the Geosquare alphabet: {gid}")
+    return column, row
+
+
+def index_to_bound(column: int, row: int, level: int) -> Tuple[float, float, float, float]:
+    """Convert the (column, row) index of a cell at level to bounds (xmin, ymin, xmax, ymax)"""
+    size = CELL_SIZE[level]
+    return (
+        LON_ORIGIN + column * size,
+        LAT_ORIGIN + row * size,
+        LON_ORIGIN + (column + 1) * size,
+        LAT_ORIGIN + (row + 1) * size,
+    )
+
+
+# === Vectorized codec ===
+
+def lonlat_to_index_array(longitude: np.ndarray, latitude: np.ndarray, level: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert arrays of longitude/latitude to (column, row) index arrays at level"""
+    factor = level_factor(level)
+    column = np.floor((np.asarray(longitude, dtype=np.float64) - LON_ORIGIN) * INDEX_SCALE).astype(np.int64)
+    row = np.floor((np.asarray(latitude, dtype=np.float64) - LAT_ORIGIN) * INDEX_SCALE).astype(np.int64)
+    return column // factor, row // factor
+
+
+def index_to_gid_array(column: np.ndarray, row: np.ndarray, level: int) -> np.ndarray:
+    """Convert (column, row) index arrays at level to an array of GIDs"""
+    column, row = np.broadcast_arrays(np.asarray(column, dtype=np.int64), np.asarray(row, dtype=np.int64))
+    codes = np.empty(column.shape + (level,), dtype=np.uint8)
+    for idx in range(level):
+        factor = level_factor(idx + 1, level)
+        part = LEVEL_PARTS[idx]
+        codes[..., idx] = ALPHABET_CODES[(row // factor) % part, (column // factor) % part]
+    return codes_to_gid_array(codes)
+
+
+def gid_to_index_array(gids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Convert an array of GIDs to (column, row, level) arrays, each at the GID's own level"""
+    codes, lengths = gid_to_codes_array(gids)
+    column = np.zeros(lengths.shape, dtype=np.int64)
+    row = np.zeros(lengths.shape, dtype=np.int64)
+    for idx in range(MAX_LEVEL):
+        active = idx < lengths
+        part = LEVEL_PARTS[idx]
+        column = np.where(active, column * part + CODE_VALUE_X[codes[..., idx]], column)
+        row = np.where(active, row * part + CODE_VALUE_Y[codes[..., idx]], row)
+    return column, row, lengths
+
+
+def index_to_bound_array(column: np.ndarray, row: np.ndarray, level) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Convert (column, row) index arrays at level (scalar or array) to bound arrays"""
+    size = np.asarray(CELL_SIZE)[level]
+    column = np.asarray(column, dtype=np.float64)
+    row = np.asarray(row, dtype=np.float64)
+    return (
+        LON_ORIGIN + column * size,
+        LAT_ORIGIN + row * size,
+        LON_ORIGIN + (column + 1) * size,
+        LAT_ORIGIN + (row + 1) * size,
+    )
+
+
+def codes_to_gid_array(codes: np.ndarray) -> np.ndarray:
+    """Join a (..., level) array of ASCII codes into an array of GID strings"""
+    level = codes.shape[-1]
+    codes = np.ascontiguousarray(codes)
+    return codes.view(f"S{level}")[..., 0].astype(f"U{level}")
+
+
+def gid_to_codes_array(gids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Split an array of GID strings into (..., 15) ASCII codes and their lengths"""
+    gids = np.asarray(gids)
+    if gids.dtype.kind not in "SU":
+        gids = gids.astype("U")
+    if gids.size and np.max(np.char.str_len(gids)) > MAX_LEVEL:
+        raise ValueError(f"GID must be at most {MAX_LEVEL} characters long")
+    raw = gids.astype(f"S{MAX_LEVEL}")
+    codes = raw.reshape(-1).view(np.uint8).reshape(raw.shape + (MAX_LEVEL,))
+    lengths = np.count_nonzero(codes, axis=-1)
+    known = CODE_VALUE_Y[codes] >= 0
+    padded = np.arange(MAX_LEVEL) >= lengths[..., None]
+    if not np.all(known | padded):
+        raise ValueError("GID contains characters outside the Geosquare alphabet")
+    # Levels split in 2 only use the top left 2x2 block of the alphabet
+    in_level = np.maximum(CODE_VALUE_Y[codes], CODE_VALUE_X[codes]) < np.array(LEVEL_PARTS)
+    if not np.all(in_level | padded):
+        raise ValueError("GID contains characters outside the alphabet of their level")
+    return codes, lengths
+
+
+# === Scanline coverage ===
+
+def window_for_bounds(xmin: float, ymin: float, xmax: float, ymax: float, level: int) -> Tuple[int, int, int, int]:
+    """Cell window (column_min, row_min, column_max, row_max) at level covering bounds, max exclusive"""
+    column_min, row_min = lonlat_to_index(xmin, ymin, level)
+    column_max, row_max = lonlat_to_index(xmax, ymax, level)
+    return column_min, row_min, column_max + 1, row_max + 1
+
+
+def cell_window(gid: str, level: int) -> Tuple[int, int, int, int]:
+    """Cell window at level covering the descendants of gid, max exclusive"""
+    factor = level_factor(len(gid), level)
+    column, row = gid_to_index(gid)
+    return column * factor, row * factor, (column + 1) * factor, (row + 1) * factor
+
+
+def enclosing_cell(xmin: float, ymin: float, xmax: float, ymax: float, max_level: int = MAX_LEVEL) -> str:
+    """GID of the finest cell at level max_level or coarser containing bounds, empty when no cell does"""
+    for level in range(max_level, 0, -1):
+        column, row = lonlat_to_index(xmin, ymin, level)
+        if (column, row) != lonlat_to_index(xmax, ymax, level):
+            continue
+        if 0 <= column < CELLS_PER_AXIS[level] and 0 <= row < CELLS_PER_AXIS[level]:
+            return index_to_gid(column, row, level)
+        return ""
+    return ""
+
+
+def descendant_index(gid: str, level: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(column, row) index arrays at level of every descendant of gid, in GID order"""
+    column, row = gid_to_index(gid)
+    factor = level_factor(len(gid), level)
+    columns = np.array([column * factor], dtype=np.int64)
+    rows = np.array([row * factor], dtype=np.int64)
+    # Expand one level at a time, digits in alphabet order (row-major)
+    for idx in range(len(gid), level):
+        part = LEVEL_PARTS[idx]
+        factor = level_factor(idx + 1, level)
+        offsets = np.arange(part * part, dtype=np.int64)
+        columns = (columns[:, None] + (offsets % part) * factor).reshape(-1)
+        rows = (rows[:, None] + (offsets // part) * factor).reshape(-1)
+    return columns, rows
+
+
+def intersect_windows(first: Tuple[int, int, int, int], second: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+    """Intersection of two cell windows at the same level"""
+    return (
+        max(first[0], second[0]),
+        max(first[1], second[1]),
+        min(first[2], second[2]),
+        min(first[3], second[3]),
+    )
+
+
+def polygons_bounds(polygons) -> Tuple[float, float, float, float]:
+    """Bounds (xmin, ymin, xmax, ymax) of polygons given as lists of (n, 2) rings"""
+    points = np.concatenate([ring for polygon in polygons for ring in polygon])
+    xmin, ymin = points.min(axis=0)
+    xmax, ymax = points.max(axis=0)
+    return float(xmin), float(ymin), float(xmax), float(ymax)
+
+
+def _polygon_edges(polygons, level: int, column_min: int, row_min: int):
+    """
+    Edges of polygons in cell units relative to the window origin.
+
+    Rings are oriented so that exteriors are counter-clockwise and holes
+    clockwise, which makes the accumulated coverage one inside a polygon and
+    zero inside its holes (nonzero fill rule).
+    """
+    size = CELL_SIZE[level]
+    x0, y0, x1, y1 = [], [], [], []
+    for polygon in polygons:
+        for ring_idx, ring in enumerate(polygon):
+            ring = np.asarray(ring, dtype=np.float64)
+            if len(ring) < 3:
+                continue
+            u = (ring[:, 0] - LON_ORIGIN) / size - column_min
+            v = (ring[:, 1] - LAT_ORIGIN) / size - row_min
+            signed_area = np.sum(u * np.roll(v, -1) - np.roll(u, -1) * v)
+            if (signed_area < 0) == (ring_idx == 0):
+                u = u[::-1]
+                v = v[::-1]
+            x0.append(u)
+            y0.append(v)
+            x1.append(np.roll(u, -1))
+            y1.append(np.roll(v, -1))
+    if not x0:
+        empty = np.empty(0)
+        return empty, empty, empty, empty
+    x0, y0, x1, y1 = (np.concatenate(values) for values in (x0, y0, x1, y1))
+    sloped = y0 != y1
+    return x0[sloped], y0[sloped], x1[sloped], y1[sloped]
+
+
+def _split_pieces(xa, ya, xb, yb, d, at: float):
+    """Split row pieces crossing the vertical line x = at into two pieces"""
+    crossing = (xa < at) != (xb < at)
+    if not np.any(crossing):
+        return xa, ya, xb, yb, d
+    t = (at - xa[crossing]) / (xb[crossing] - xa[crossing])
+    y_split = ya[crossing] + t * (yb[crossing] - ya[crossing])
+    d_first = d[crossing] * t
+    xb_first = xb.copy()
+    yb_first = yb.copy()
+    d_rest = d.copy()
+    xb_first[crossing] = at
+    yb_first[crossing] = y_split
+    d_rest[crossing] = d_first
+    return (
+        np.concatenate([xa, np.full(t.shape, at)]),
+        np.concatenate([ya, y_split]),
+        np.concatenate([xb_first, xb[crossing]]),
+        np.concatenate([yb_first, yb[crossing]]),
+        np.concatenate([d_rest, d[crossing] - d_first]),
+    )
+
+
+def _accumulate_kernel(buffer, rows, position, weight):
+    """Scatter the second differences of the coverage kernel at position"""
+    floor = np.floor(position)
+    fraction = position - floor
+    column = floor.astype(np.intp)
+    np.add.at(buffer, (rows, column), weight * (1 - fraction) ** 2 / 2)
+    np.add.at(buffer, (rows, column + 1), weight * (1.5 - fraction - (1 - fraction) ** 2))
+    np.add.at(buffer, (rows, column + 2), weight * (fraction - 0.5 + (1 - fraction) ** 2 / 2))
+
+
+def _accumulate_step(buffer, rows, position, weight):
+    """Scatter the second differences of a vertical piece at position"""
+    floor = np.floor(position)
+    fraction = position - floor
+    column = floor.astype(np.intp)
+    np.add.at(buffer, (rows, column), weight * (1 - fraction))
+    np.add.at(buffer, (rows, column + 1), weight * (2 * fraction - 1))
+    np.add.at(buffer, (rows, column + 2), weight * -fraction)
+
+
+def polygon_coverage(polygons, level: int, window: Tuple[int, int, int, int] = None, max_buffer: int = 4000000):
+    """
+    Exact fraction of every cell at level covered by polygons, row band by row band.
+
+    polygons is a list of polygons, each a list of (n, 2) coordinate rings
+    in EPSG:4326 with the exterior first. window restricts the result to the
+    cell window (column_min, row_min, column_max, row_max) and defaults to
+    the bounds of the polygons.
+
+    Every edge is cut into one piece per cell row. Each piece adds the signed
+    area it sweeps to its right as a handful of second differences, and two
+    cumulative sums along the row turn these into coverage fractions. No cell
+    is ever tested individually.
+
+    Yields (columns, rows, fractions) arrays for the cells with a non-zero
+    coverage, in row-major order.
+    """
+    if window is None:
+        window = window_for_bounds(*polygons_bounds(polygons), level)
+    column_min, row_min, column_max, row_max = window
+    width = column_max - column_min
+    height = row_max - row_min
+    if width <= 0 or height <= 0:
+        return
+    x0, y0, x1, y1 = _polygon_edges(polygons, level, column_min, row_min)
+    if not len(x0):
+        return
+    v_min = np.minimum(y0, y1)
+    v_max = np.maximum(y0, y1)
+    band_rows = max(1, min(height, max_buffer // (width + 3)))
+
+    for band_start in range(0, height, band_rows):
+        band_end = min(band_start + band_rows, height)
+        in_band = (v_max > band_start) & (v_min < band_end)
+        if not np.any(in_band):
+            continue
+        ex0, ey0, ex1, ey1 = x0[in_band], y0[in_band], x1[in_band], y1[in_band]
+        lo = np.maximum(np.minimum(ey0, ey1), band_start)
+        hi = np.minimum(np.maximum(ey0, ey1), band_end)
+        first_row = np.floor(lo).astype(np.intp)
+        counts = np.maximum(np.ceil(hi).astype(np.intp) - first_row, 0)
+
+        # Cut edges into one piece per cell row
+        edge = np.repeat(np.arange(len(ex0)), counts)
+        row = first_row[edge] + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        ya = np.maximum(row, lo[edge])
+        yb = np.minimum(row + 1, hi[edge])
+        keep = yb > ya
+        edge, row, ya, yb = edge[keep], row[keep], ya[keep], yb[keep]
+        slope = (ex1 - ex0)[edge] / (ey1 - ey0)[edge]
+        xa = ex0[edge] + (ya - ey0[edge]) * slope
+        xb = ex0[edge] + (yb - ey0[edge]) * slope
+        # Downward pieces add coverage to their right, upward pieces remove it
+        d = np.where(ey0[edge] > ey1[edge], 1.0, -1.0) * (yb - ya)
+
+        # Pieces outside the window only matter through the coverage they
+        # carry into it, so split them at the window edges and clamp
+        xa, ya, xb, yb, d = _split_pieces(xa, ya, xb, yb, d, 0.0)
+        xa, ya, xb, yb, d = _split_pieces(xa, ya, xb, yb, d, float(width))
+        xa = np.clip(xa, 0, width)
+        xb = np.clip(xb, 0, width)
+        row = np.floor(np.minimum(ya, yb)).astype(np.intp) - band_start
+
+        buffer = np.zeros((band_end - band_start, width + 3))
+        x_lo = np.minimum(xa, xb)
+        x_hi = np.maximum(xa, xb)
+        vertical = x_hi - x_lo < 1e-9
+        middle = (x_lo + x_hi) / 2
+        _accumulate_step(buffer, row[vertical], middle[vertical], d[vertical])
+        sloped = ~vertical
+        weight = d[sloped] / (x_hi[sloped] - x_lo[sloped])
+        _accumulate_kernel(buffer, row[sloped], x_lo[sloped], weight)
+        _accumulate_kernel(buffer, row[sloped], x_hi[sloped], -weight)
+
+        coverage = np.cumsum(np.cumsum(buffer, axis=1), axis=1)[:, :width]
+        np.clip(coverage, 0, 1, out=coverage)
+        rows, columns = np.nonzero(coverage > 1e-9)
+        yield columns + column_min, rows + band_start + row_min, coverage[rows, columns]
+
+
+def points_in_polygons(x: np.ndarray, y: np.ndarray, polygons) -> np.ndarray:
+    """
+    Whether points are inside polygons given as lists of (n, 2) rings, by
+    the nonzero fill rule of the coverage. Points sharing a y coordinate,
+    such as the centers of a row of cells, are tested together.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    inside = np.zeros(x.shape, dtype=bool)
+    x0, y0, x1, y1 = _polygon_edges(polygons, 0, 0, 0)
+    if not len(x0) or not len(x):
+        return inside
+    u = (x - LON_ORIGIN) / CELL_SIZE[0]
+    v = (y - LAT_ORIGIN) / CELL_SIZE[0]
+    rows, inverse = np.unique(v, return_inverse=True)
+    for idx, row in enumerate(rows):
+        crossing = (y0 > row) != (y1 > row)
+        cross_x = x0[crossing] + (row - y0[crossing]) * (x1[crossing] - x0[crossing]) / (y1[crossing] - y0[crossing])
+        order = np.argsort(cross_x)
+        # winding number of the edges crossing the row right of each position
+        winding = np.append(np.cumsum(np.where(y1[crossing] > y0[crossing], 1, -1)[order][::-1])[::-1], 0)
+        points = np.flatnonzero(inverse == idx)
+        inside[points] = winding[np.searchsorted(cross_x[order], u[points], side='right')] != 0
+    return inside
+
+
+def polyfill_index(polygons, level: int, fullcover: bool = True, window: Tuple[int, int, int, int] = None):
+    """
+    Cells at level covered by polygons, as (columns, rows) arrays per row band.
+
+    With fullcover every cell with a non-zero overlap is returned, otherwise
+    only cells covered by more than half of their area.
+    """
+    for columns, rows, fractions in polygon_coverage(polygons, level, window):
+        if not fullcover:
+            selected = fractions > 0.5
+            columns, rows = columns[selected], rows[selected]
+        yield columns, rows
+
+
+def polyfill_tile(tile: str, polygons, level: int, fullcover: bool = True) -> np.ndarray:
+    """
+    Sorted GIDs at level inside the tile cell that are covered by polygons.
+
+    This is the task run by polyfill worker processes, so it only takes and
+    returns plain Python and NumPy values.
+    """
+    gids = []
+    if polygons:
+        window = intersect_windows(
+            cell_window(tile, level),
+            window_for_bounds(*polygons_bounds(polygons), level),
+        )
+        for columns, rows in polyfill_index(polygons, level, fullcover, window):
+            gids.append(index_to_gid_array(columns, rows, level))
+    if not gids:
+        return np.empty(0, dtype=f"U{level}")
+    return np.sort(np.concatenate(gids))
@@ -1,11 +1,15 @@
-import functools
-from typing import Tuple, List,Union
-from qgis.core import QgsGeometry, QgsFeatureSink, QgsFeature, QgsProcessingFeedback, QgsFields, QgsField
+import collections
+import itertools
+import numpy as np
+from typing import Iterator, Tuple, List, Union
+from qgis.core import QgsGeometry, QgsFeatureSink, QgsFeature, QgsProcessingFeedback, QgsFields, QgsField, QgsRectangle, QgsWkbTypes
 from PyQt5.QtCore import QVariant
+from . import geosquare_core, process_pool
+from .grid_cache import GridCache, shared_cache
 
 
 class GeosquareGrid:
-    def __init__(self):
+    def __init__(self, cache: GridCache = None):
         # Initialize instance variables
         self.longitude = None
         self.latitude = None
@@ -42,6 +46,9 @@ class GeosquareGrid:
         }
         
         self.d = [5, 2, 5, 2, 5, 2, 5, 2, 5, 2, 5, 2, 5, 2, 5]
+        self.POLYFILL_METHODS = ("prepared", "area", "scanline")
+        self.GID_FIELDS = QgsFields()
+        self.GID_FIELDS.append(QgsField('gid', QVariant.String))
         self.size_level = {
             10000000: 1, 5000000: 2, 1000000: 3, 500000: 4,
             100000: 5, 50000: 6, 10000: 7, 5000: 8,
@@ -49,80 +56,142 @@ class GeosquareGrid:
             10: 13, 5: 14, 1: 15,
         }
         
-        # Cache for expensive operations
-        self._geometry_cache = {}
-        self._lonlat_cache = {}
-        self._bound_cache = {}
+        # Packed integer GIDs: one digit per level in the mixed 25/4 radix of
+        # self.d, most significant level first, with the level in the low bits
+        self.INT_LEVEL_BITS = 4
+        self._INT_RADIX = [part * part for part in self.d]
+        self._INT_WEIGHTS = [1] * len(self.d)
+        for idx in range(len(self.d) - 2, -1, -1):
+            self._INT_WEIGHTS[idx] = self._INT_WEIGHTS[idx + 1] * self._INT_RADIX[idx + 1]
+
+        # Cache for expensive operations, shared between instances by default
+        self.cache = cache if cache is not None else shared_cache
 
     # === Core coordinate/GID conversion methods ===
     
-    @functools.lru_cache(maxsize=128)
     def lonlat_to_gid(self, longitude: float, latitude: float, level: int) -> str:
         """Convert longitude/latitude to GID with bounds checking and caching"""
         assert -180 <= longitude <= 180, "Longitude must be between -180 and 180"
         assert -90 <= latitude <= 90, "Latitude must be between -90 and 90"
         assert 1 <= level <= 15, "Level must be between 1 and 15"
-        
-        lat_ranged = (-216, 233.157642055036)
-        lon_ranged = (-217, 232.157642055036)
-        gid = ""
-        
-        for part in self.d[:level]:
-            position_x = int((longitude - lon_ranged[0]) / (lon_ranged[1] - lon_ranged[0]) * part)
-            position_y = int((latitude - lat_ranged[0]) / (lat_ranged[1] - lat_ranged[0]) * part)
-            
-            part_x = (lon_ranged[1] - lon_ranged[0]) / part
-            part_y = (lat_ranged[1] - lat_ranged[0]) / part
-            
-            shift_x = part_x * position_x
-            shift_y = part_y * position_y
-            
-            lon_ranged = (lon_ranged[0] + shift_x, lon_ranged[0] + shift_x + part_x)
-            lat_ranged = (lat_ranged[0] + shift_y, lat_ranged[0] + shift_y + part_y)
-            
-            gid += self.CODE_ALPHABET[position_y][position_x]
-            
-        return gid
 
-    @functools.lru_cache(maxsize=128)
+        return self.cache.get_or_compute(
+            'gid', level, (longitude, latitude),
+            lambda: geosquare_core.index_to_gid(
+                *geosquare_core.lonlat_to_index(longitude, latitude, level), level)
+        )
+
     def gid_to_lonlat(self, gid: str) -> Tuple[float, float]:
         """Convert GID to longitude/latitude with caching"""
-            
-        lat_ranged = (-216, 233.157642055036)
-        lon_ranged = (-217, 232.157642055036)
-        
-        for idx, char in enumerate(gid):
-            part_x = (lon_ranged[1] - lon_ranged[0]) / self.d[idx]
-            part_y = (lat_ranged[1] - lat_ranged[0]) / self.d[idx]
-            
-            shift_x = part_x * self.CODE_ALPHABET_VALUE[char][1]
-            shift_y = part_y * self.CODE_ALPHABET_VALUE[char][0]
-            
-            lon_ranged = (lon_ranged[0] + shift_x, lon_ranged[0] + shift_x + part_x)
-            lat_ranged = (lat_ranged[0] + shift_y, lat_ranged[0] + shift_y + part_y)
-            
-        result = (lon_ranged[0], lat_ranged[0])
-        return result
+        xmin, ymin, _, _ = self.gid_to_bound(gid)
+        return xmin, ymin
 
-    @functools.lru_cache(maxsize=128)
     def gid_to_bound(self, gid: str) -> Tuple[float, float, float, float]:
         """Convert GID to bounds (xmin, ymin, xmax, ymax) with caching"""
-            
-        lat_ranged = (-216, 233.157642055036)
-        lon_ranged = (-217, 232.157642055036)
-        
-        for idx, char in enumerate(gid):
-            part_x = (lon_ranged[1] - lon_ranged[0]) / self.d[idx]
-            part_y = (lat_ranged[1] - lat_ranged[0]) / self.d[idx]
-            
-            shift_x = part_x * self.CODE_ALPHABET_VALUE[char][1]
-            shift_y = part_y * self.CODE_ALPHABET_VALUE[char][0]
-            
-            lon_ranged = (lon_ranged[0] + shift_x, lon_ranged[0] + shift_x + part_x)
-            lat_ranged = (lat_ranged[0] + shift_y, lat_ranged[0] + shift_y + part_y)
-            
-        result = (lon_ranged[0], lat_ranged[0], lon_ranged[1], lat_ranged[1])
-        return result
+        return self.cache.get_or_compute(
+            'bound', len(gid), gid,
+            lambda: geosquare_core.index_to_bound(*geosquare_core.gid_to_index(gid), len(gid))
+        )
+
+    # === Vectorized batch conversion methods ===
+
+    def lonlat_to_gid_array(self, longitude: np.ndarray, latitude: np.ndarray, level: int) -> np.ndarray:
+        """Convert arrays of longitude/latitude to an array of GIDs"""
+        longitude = np.asarray(longitude, dtype=np.float64)
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude, latitude = np.broadcast_arrays(longitude, latitude)
+        assert np.all((-180 <= longitude) & (longitude <= 180)), "Longitude must be between -180 and 180"
+        assert np.all((-90 <= latitude) & (latitude <= 90)), "Latitude must be between -90 and 90"
+        assert 1 <= level <= 15, "Level must be between 1 and 15"
+
+        column, row = geosquare_core.lonlat_to_index_array(longitude, latitude, level)
+        return geosquare_core.index_to_gid_array(column, row, level)
+
+    def gid_to_lonlat_array(self, gids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Convert an array of GIDs to arrays of longitude/latitude"""
+        xmin, ymin, _, _ = self.gid_to_bound_array(gids)
+        return xmin, ymin
+
+    def gid_to_bound_array(self, gids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Convert an array of GIDs to arrays of bounds (xmin, ymin, xmax, ymax)"""
+        column, row, level = geosquare_core.gid_to_index_array(gids)
+        return geosquare_core.index_to_bound_array(column, row, level)
+
+    # === Packed integer GID methods ===
+
+    def gid_to_int(self, gid: str) -> int:
+        """Convert GID to its packed 64-bit integer representation"""
+        assert 1 <= len(gid) <= 15, "GID must be between 1 and 15 characters long"
+        value = 0
+        try:
+            for idx, char in enumerate(gid):
+                value += self.CODE_ALPHABET_INDEX[self.d[idx]][char] * self._INT_WEIGHTS[idx]
+        except KeyError:
+            raise ValueError(f"GID contains characters outside the alphabet of their level: {gid}")
+        return (value << self.INT_LEVEL_BITS) | len(gid)
+
+    def int_to_gid(self, value: int) -> str:
+        """Convert packed 64-bit integer to GID"""
+        level = self.int_level(value)
+        assert 1 <= level <= 15, "Level must be between 1 and 15"
+        digits = int(value) >> self.INT_LEVEL_BITS
+        gid = ""
+        for idx in range(level):
+            digit = (digits // self._INT_WEIGHTS[idx]) % self._INT_RADIX[idx]
+            gid += self.CODE_ALPHABET_[self.d[idx]][digit]
+        return gid
+
+    def int_level(self, value: int) -> int:
+        """Get the level of a packed integer GID"""
+        return int(value) & ((1 << self.INT_LEVEL_BITS) - 1)
+
+    def int_to_parent(self, value: int) -> int:
+        """Get parent of a packed integer GID"""
+        level = self.int_level(value)
+        if level <= 1:
+            return int(value)
+        digits = int(value) >> self.INT_LEVEL_BITS
+        weight = self._INT_WEIGHTS[level - 1]
+        digits -= (digits // weight) % self._INT_RADIX[level - 1] * weight
+        return (digits << self.INT_LEVEL_BITS) | (level - 1)
+
+    def int_to_children(self, value: int) -> Tuple[int, ...]:
+        """Get all children of a packed integer GID"""
+        level = self.int_level(value)
+        assert level < 15, "GID at level 15 has no children"
+        digits = int(value) >> self.INT_LEVEL_BITS
+        weight = self._INT_WEIGHTS[level]
+        return tuple(
+            ((digits + digit * weight) << self.INT_LEVEL_BITS) | (level + 1)
+            for digit in range(self._INT_RADIX[level])
+        )
+
+    def gid_to_int_array(self, gids: np.ndarray) -> np.ndarray:
+        """Convert an array of GIDs to packed uint64 integers"""
+        # Raises ValueError for characters outside the alphabet of their level
+        codes, lengths = geosquare_core.gid_to_codes_array(gids)
+        if np.any(lengths < 1):
+            raise ValueError("GID must be between 1 and 15 characters long")
+        digits = np.zeros(lengths.shape, dtype=np.uint64)
+        for idx in range(len(self.d)):
+            active = idx < lengths
+            digit = geosquare_core.CODE_VALUE_Y[codes[..., idx]] * self.d[idx] + geosquare_core.CODE_VALUE_X[codes[..., idx]]
+            digit = np.where(active, digit, 0).astype(np.uint64)
+            digits += digit * np.uint64(self._INT_WEIGHTS[idx])
+        return (digits << np.uint64(self.INT_LEVEL_BITS)) | lengths.astype(np.uint64)
+
+    def int_to_gid_array(self, values: np.ndarray) -> np.ndarray:
+        """Convert an array of packed uint64 integers to GIDs"""
+        values = np.asarray(values, dtype=np.uint64)
+        lengths = (values & np.uint64((1 << self.INT_LEVEL_BITS) - 1)).astype(np.intp)
+        assert np.all((1 <= lengths) & (lengths <= 15)), "Level must be between 1 and 15"
+        digits = values >> np.uint64(self.INT_LEVEL_BITS)
+        codes = np.zeros(values.shape + (len(self.d),), dtype=np.uint8)
+        for idx, part in enumerate(self.d):
+            digit = ((digits // np.uint64(self._INT_WEIGHTS[idx])) % np.uint64(part * part)).astype(np.intp)
+            char = geosquare_core.ALPHABET_CODES[digit // part, digit % part]
+            codes[..., idx] = np.where(idx < lengths, char, 0)
+        return geosquare_core.codes_to_gid_array(codes).astype("U15")
 
     # === Public interface methods ===
     
@@ -187,12 +256,17 @@ class GeosquareGrid:
 
     # === Geometry related methods ===
     
-    @functools.lru_cache(maxsize=64)
-    def gid_to_geometry(self, gid: str) -> QgsGeometry:
-        """Convert GID to geometry with caching"""
-        geom_wkt = self._gid_to_geometry_wkt(gid)
-        result = QgsGeometry.fromWkt(geom_wkt)
-        return result
+    def gid_to_geometry(self, gid: str, cached: bool = True) -> QgsGeometry:
+        """Convert GID to geometry, with caching unless the cell is visited only once"""
+        if not cached:
+            column, row = geosquare_core.gid_to_index(gid)
+            return QgsGeometry.fromRect(QgsRectangle(*geosquare_core.index_to_bound(column, row, len(gid))))
+        geometry = self.cache.get_or_compute(
+            'geometry', len(gid), gid,
+            lambda: QgsGeometry.fromWkt(self._gid_to_geometry_wkt(gid))
+        )
+        # Hand out a copy so callers cannot modify the cached geometry
+        return QgsGeometry(geometry)
 
     def _gid_to_geometry_wkt(self, gid: str) -> str:
         """Convert GID to WKT geometry string"""
@@ -235,47 +309,44 @@ class GeosquareGrid:
 
     # === Spatial operations ===
 
+    def gid_to_descendants_array(self, key: str, size: int) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """Get all descendant GIDs of key at size and their bounds, in GID order"""
+        assert size in self.size_level, f"size must be in {list(self.size_level.keys())}"
+        level = self.size_level[size]
+        if level < len(key):
+            raise ValueError("size must not be larger than the cell size of the GID")
+        columns, rows = geosquare_core.descendant_index(key, level)
+        return (
+            geosquare_core.index_to_gid_array(columns, rows, level),
+            geosquare_core.index_to_bound_array(columns, rows, level),
+        )
+
     def parrent_to_allchildren(self, key: str, size: int, geometry: QgsGeometry = None, as_feature: bool = False) -> List[str]:
-        """Get all children or parent  GIDs for a given GID"""
-        resolution = self.size_level[size]
-        fields = QgsFields()
-        fields.append(QgsField('gid', QVariant.String))
-        parrent_resolution = len(key) - resolution
-        if resolution < parrent_resolution:
-            raise ValueError("resolution must be less than or equal to the length of the GID")
-        if resolution == parrent_resolution:
-            return [key]
-        keys = []
-        queue = [key]
-        while queue:
-            current_key = queue.pop(0)
-            if len(current_key) == resolution:
-                if geometry is not None:
-                    if self._area_ratio(self.gid_to_geometry(current_key), geometry) > 0:
-                        if as_feature:
-                            geom = self.gid_to_geometry(current_key)
-                            feature = QgsFeature(fields)
-                            feature.setGeometry(geom)
-                            feature.setAttribute("gid", current_key)
-                            keys.append(feature)
-                        else:
-                            keys.append(current_key)
-                else:
-                    if as_feature:
-                        geom = self.gid_to_geometry(current_key)
-                        feature = QgsFeature(fields)
-                        feature.setGeometry(geom)
-                        feature.setAttribute("gid", current_key)
-                        keys.append(feature)
-                    else:
-                        keys.append(current_key)
-            elif len(current_key) > resolution:
-                break
-            else:
-                for child_key in self._to_children(current_key):
-                    queue.append(child_key)
+        """Get all descendant GIDs of key at size, only those overlapping geometry if given"""
+        keys, bounds = self.gid_to_descendants_array(key, size)
+        if geometry is not None:
+            engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+            engine.prepareGeometry()
+            parent = self.gid_to_geometry(key, cached=False).constGet()
+            if not engine.intersects(parent) or engine.touches(parent):
+                keys = keys[:0]
+            elif not engine.contains(parent):
+                # Partially covered parent: test the hierarchy below it
+                resolution = self.size_level[size]
+                keys = np.array(list(itertools.chain.from_iterable(self._iter_contained_keys(
+                    geometry, key, [resolution, resolution], QgsProcessingFeedback()
+                ))), dtype=keys.dtype)
+                bounds = self.gid_to_bound_array(keys) if as_feature else None
+        if not as_feature:
+            return keys.tolist()
 
-        return keys
+        features = []
+        for gid, bound in zip(keys.tolist(), zip(*(bound.tolist() for bound in bounds))):
+            feature = QgsFeature(self.GID_FIELDS)
+            feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(*bound)))
+            feature.setAttribute("gid", gid)
+            features.append(feature)
+        return features
 
     
     def _to_children(self, key: str) -> Tuple[str, ...]:
@@ -294,94 +365,240 @@ class GeosquareGrid:
         feedback: QgsProcessingFeedback,
         fullcover: bool = True,
         as_feature: bool = False,
-        sink: QgsFeatureSink = None
+        sink: QgsFeatureSink = None,
+        method: str = "prepared",
+        batch_size: int = 1024,
     ) -> List[str]:
         """Find all grid cells that overlap with geometry at specified resolution"""
-           
-        if initial_key != "2":
-            geometry = geometry.intersection(self.gid_to_geometry(initial_key))
         contained_keys = []
-        def func(key, approved):
-            if approved:
-                if resolution[0] <= len(key) <= resolution[1]:
-                    if sink is not None:
-                        geom = self.gid_to_geometry(key)
-                        feature = QgsFeature()
-                        feature.setGeometry(geom)
-                        feature.setAttributes([key])
-                        sink.addFeature(feature, QgsFeatureSink.FastInsert)
-                    else:
-                        if as_feature:
-                            geom = self.gid_to_geometry(key)
-                            feature = QgsFeature()
-                            feature.setGeometry(geom)
-                            feature.setAttributes([key])
-                            contained_keys.append(feature)
-                        else:
-                            contained_keys.append(key)
-                else:
-                    for child_key in self._to_children(key):
-                        if feedback.isCanceled():
-                            break
-                        func(child_key, True)
-            else:
-                area_ratio = self._area_ratio(
-                    self.gid_to_geometry(key), geometry)
-                if area_ratio == 0:
-                    last_idx = self.CODE_ALPHABET_[self.d[0]].index(key[-1])
-                    if (last_idx < 25) & (len(key) == 1):
-                        func(
-                            key[:-1] + self.CODE_ALPHABET_[self.d[0]
-                                                           ][last_idx + 1][0],
-                            False,
-                        )
-                    else:
+        for keys in self._iter_contained_keys(
+            geometry, initial_key, resolution, feedback, fullcover, method, batch_size
+        ):
+            self._collect_cells(keys, contained_keys, as_feature, sink)
+        return contained_keys
+
+    def _iter_contained_keys(
+        self,
+        geometry: QgsGeometry,
+        initial_key: str,
+        resolution: List[int],
+        feedback: QgsProcessingFeedback,
+        fullcover: bool = True,
+        method: str = "prepared",
+        batch_size: int = 1024,
+    ) -> Iterator[List[str]]:
+        """Yield batches of at most batch_size GIDs of cells that overlap with geometry, in polyfill order"""
+        assert method in self.POLYFILL_METHODS, f"method must be in {self.POLYFILL_METHODS}"
+
+        if method == "scanline":
+            yield from self._iter_scanline_keys(
+                geometry, initial_key, resolution[1], feedback, fullcover, batch_size
+            )
+            return
+
+        if initial_key == "2" and not geometry.isEmpty():
+            # Descend from the cell enclosing the geometry rather than the
+            # root, cells above it only touch the geometry at most
+            bounds = geometry.boundingBox()
+            initial_key = geosquare_core.enclosing_cell(
+                bounds.xMinimum(), bounds.yMinimum(), bounds.xMaximum(), bounds.yMaximum(), resolution[0]
+            ) or "2"
+        elif initial_key != "2":
+            geometry = geometry.intersection(self.gid_to_geometry(initial_key, cached=False))
+
+        engine = None
+        if method == "prepared":
+            engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+            engine.prepareGeometry()
+
+        def relation(key, need_ratio):
+            # Area ratio of the cell covered by geometry. The prepared engine
+            # answers 0 and 1 with predicates and returns None for a partially
+            # covered cell unless the actual ratio is needed.
+            cell = self.gid_to_geometry(key, cached=False)
+            if engine is None:
+                return self._area_ratio(cell, geometry)
+            cell_geometry = cell.constGet()
+            if not engine.intersects(cell_geometry) or engine.touches(cell_geometry):
+                return 0
+            if engine.contains(cell_geometry):
+                return 1
+            if need_ratio:
+                return self._area_ratio(cell, geometry)
+            return None
+
+        def descendants(key, level):
+            # All descendants of key at level, in GID order
+            suffixes = itertools.product(
+                *(self.CODE_ALPHABET_[self.d[idx]] for idx in range(len(key), level))
+            )
+            for suffix in suffixes:
+                yield key + "".join(suffix)
+
+        # Cells partially covered by geometry, processed one level at a time.
+        # Fully covered cells never enter the frontier. Cells to emit are kept
+        # as keys and expanded once the frontier is empty, sorted so that cells
+        # come out in GID order like the former depth-first recursion.
+        if initial_key == "2":
+            frontier = list(self.CODE_ALPHABET_[self.d[0]])
+        else:
+            frontier = [initial_key]
+
+        covered = []
+        while frontier:
+            level = len(frontier[0])
+            at_resolution = level == resolution[1]
+            need_ratio = at_resolution and not fullcover
+            next_frontier = []
+            for offset in range(0, len(frontier), batch_size):
+                if feedback.isCanceled():
+                    return
+                for key in frontier[offset:offset + batch_size]:
+                    area_ratio = relation(key, need_ratio)
+                    if area_ratio == 0:
+                        continue
+                    elif area_ratio == 1:
+                        covered.append(key)
+                    elif at_resolution and fullcover:
+                        covered.append(key)
+                    elif at_resolution and area_ratio is not None and area_ratio > 0.5:
+                        covered.append(key)
+                    elif not at_resolution:
+                        next_frontier.extend(self._to_children(key))
+            feedback.setProgressText(f"Polyfill level {level}: {len(frontier)} cells tested")
+            frontier = next_frontier
+
+        found = []
+        for key in sorted(covered):
+            for child_key in descendants(key, max(len(key), resolution[0])):
+                found.append(child_key)
+                if len(found) >= batch_size:
+                    if feedback.isCanceled():
                         return
-                elif area_ratio == 1:
-                    func(key, True)
-                elif (len(key) == resolution[1]) & fullcover:
-                    if sink is not None:
-                        geom = self.gid_to_geometry(key)
-                        feature = QgsFeature()
-                        feature.setGeometry(geom)
-                        feature.setAttributes([key])
-                        sink.addFeature(feature, QgsFeatureSink.FastInsert)
-                    else:
-                        if as_feature:
-                            geom = self.gid_to_geometry(key)
-                            feature = QgsFeature()
-                            feature.setGeometry(geom)
-                            feature.setAttributes([key])
-                            contained_keys.append(feature)
-                        else:
-                            contained_keys.append(key)
-                elif (len(key) == resolution[1]) & (area_ratio > 0.5) & (~fullcover):
-                    if sink is not None:
-                        geom = self.gid_to_geometry(key)
-                        feature = QgsFeature()
-                        feature.setGeometry(geom)
-                        feature.setAttributes([key])
-                        sink.addFeature(feature, QgsFeatureSink.FastInsert)
-                    else:
-                        if as_feature:
-                            geom = self.gid_to_geometry(key)
-                            feature = QgsFeature()
-                            feature.setGeometry(geom)
-                            feature.setAttributes([key])
-                            contained_keys.append(feature)
-                        else:
-                            contained_keys.append(key)
-                elif len(key) == resolution[1]:
+                    yield found
+                    found = []
+        if found:
+            yield found
+
+    def _iter_scanline_keys(
+        self,
+        geometry: QgsGeometry,
+        initial_key: str,
+        level: int,
+        feedback: QgsProcessingFeedback,
+        fullcover: bool = True,
+        batch_size: int = 1024,
+    ) -> Iterator[List[str]]:
+        """Yield batches of GIDs of cells at level that overlap with geometry by scanline rasterization"""
+        polygons = self._geometry_polygons(geometry)
+        if not polygons:
+            return
+
+        if initial_key != "2":
+            # Only the descendants of the start cell, sorted in GID order like
+            # the tiles of polyfill_parallel
+            keys = geosquare_core.polyfill_tile(initial_key, polygons, level, fullcover).tolist()
+            for offset in range(0, len(keys), batch_size):
+                if feedback.isCanceled():
                     return
-                else:
-                    for child_key in self._to_children(key):
-                        if feedback.isCanceled():
-                            break
-                        func(child_key, False)
+                yield keys[offset:offset + batch_size]
+            return
 
-        func(initial_key, False)
+        window = geosquare_core.window_for_bounds(*geosquare_core.polygons_bounds(polygons), level)
+        for columns, rows in geosquare_core.polyfill_index(polygons, level, fullcover, window):
+            # Encode one batch at a time, a row band can hold millions of cells
+            for offset in range(0, len(columns), batch_size):
+                if feedback.isCanceled():
+                    return
+                yield geosquare_core.index_to_gid_array(
+                    columns[offset:offset + batch_size], rows[offset:offset + batch_size], level
+                ).tolist()
+
+    def _collect_cells(self, keys: List[str], contained_keys: list, as_feature: bool, sink: QgsFeatureSink) -> None:
+        """Append cells to contained_keys, as GIDs or features, or add them to the sink"""
+        if sink is None and not as_feature:
+            contained_keys.extend(keys)
+            return
+        for key, bound in zip(keys, zip(*(bound.tolist() for bound in self.gid_to_bound_array(keys)))):
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(*bound)))
+            feature.setAttributes([key])
+            if sink is not None:
+                sink.addFeature(feature, QgsFeatureSink.FastInsert)
+            else:
+                contained_keys.append(feature)
+
+    def polyfill_parallel(
+        self,
+        geometry: QgsGeometry,
+        size: int,
+        feedback: QgsProcessingFeedback,
+        workers: int = None,
+        fullcover: bool = True,
+        as_feature: bool = False,
+        sink: QgsFeatureSink = None,
+        tile_size: int = 10000,
+    ) -> List[str]:
+        """
+        Polyfill geometry tile by tile in worker processes
+
+        The geometry is split into tile_size parent cells, each tile is clipped
+        and rasterized with the scanline core in a pool of worker processes
+        (one per CPU core by default), and the results are merged back in
+        deterministic GID order. This is the order of a serial scanline
+        polyfill of each tile with start set to the tile.
+        """
+        assert size in self.size_level, f"size must be in {list(self.size_level.keys())}"
+        assert tile_size in self.size_level, f"tile_size must be in {list(self.size_level.keys())}"
+        level = self.size_level[size]
+        tile_size = max(tile_size, size)
+        workers = workers or process_pool.default_workers()
+
+        contained_keys = []
+        tiles = sorted(self.polyfill(geometry, tile_size, feedback))
+        if not tiles:
+            return contained_keys
+
+        core = process_pool.load_core()
+        pending = collections.deque()
+        remaining = iter(tiles)
+        done = 0
+        with process_pool.create_pool(workers) as pool:
+            while True:
+                # Keep a bounded number of tiles in flight
+                while len(pending) < 2 * workers and not feedback.isCanceled():
+                    tile = next(remaining, None)
+                    if tile is None:
+                        break
+                    clipped = geometry.clipped(QgsRectangle(*self.gid_to_bound(tile)))
+                    pending.append(pool.submit(
+                        core.polyfill_tile, tile, self._geometry_polygons(clipped), level, fullcover
+                    ))
+                if not pending or feedback.isCanceled():
+                    break
+                keys = pending.popleft().result()
+                self._collect_cells(keys.tolist(), contained_keys, as_feature, sink)
+                done += 1
+                feedback.setProgress(int(100 * done / len(tiles)))
+            for future in pending:
+                future.cancel()
         return contained_keys
 
+    @staticmethod
+    def _geometry_polygons(geometry: QgsGeometry) -> List[List[np.ndarray]]:
+        """Polygon parts of geometry as lists of (n, 2) coordinate rings, exterior first"""
+        polygons = []
+        if geometry is None or geometry.isEmpty():
+            return polygons
+        for part in geometry.asGeometryCollection():
+            if part.type() != QgsWkbTypes.PolygonGeometry:
+                continue
+            for polygon in (part.asMultiPolygon() if part.isMultipart() else [part.asPolygon()]):
+                rings = [np.array([(point.x(), point.y()) for point in ring]) for ring in polygon]
+                if rings:
+                    polygons.append(rings)
+        return polygons
+
     def polyfill(
         self, 
         geometry: QgsGeometry, 
@@ -391,27 +608,149 @@ class GeosquareGrid:
         fullcover: bool = True,
         as_feature: bool = False,
         sink: QgsFeatureSink = None,
+        method: str = "prepared",
     ) -> List[str]:
-        """Find all grid cells that overlap with geometry at specified size(s)"""
-        # Handle size parameter - convert to resolution levels
-        if isinstance(size, list):
-            assert size[0] > size[1], "size must be in [min, max] format"
-            assert size[0] in self.size_level, f"size must be in {list(self.size_level.keys())}"
-            assert size[1] in self.size_level, f"size must be in {list(self.size_level.keys())}"
-            resolution = [self.size_level[i] for i in size]
-        else:
-            assert size in self.size_level, f"size must be in {list(self.size_level.keys())}"
-            resolution = [self.size_level[size], self.size_level[size]]
-            
+        """
+        Find all grid cells that overlap with geometry at specified size(s)
+
+        method selects how cells are tested against the geometry: "prepared"
+        uses predicates of a prepared geometry engine and only computes an
+        intersection area where fullcover=False needs it, "area" computes the
+        intersection area ratio of every visited cell. "scanline" skips the
+        hierarchy and rasterizes the polygon edges row by row at the finest
+        requested size, which is the fast path for fine grids over large
+        areas. It only emits cells at the finest size, row by row, or in GID
+        order when start restricts it to one cell.
+        """
         return self._get_contained_keys(
             geometry,
             start,
-            resolution,
+            self._size_resolution(size),
             feedback,
             fullcover,
             as_feature,
-            sink
+            sink,
+            method
+        )
+
+    def iter_polyfill(
+        self,
+        geometry: QgsGeometry,
+        size: Union[int, List[int]],
+        feedback: QgsProcessingFeedback = None,
+        start: str = "2",
+        fullcover: bool = True,
+        method: str = "prepared",
+        batch_size: int = None,
+    ) -> Iterator[Union[str, List[str]]]:
+        """
+        Lazily yield the GIDs of grid cells that overlap with geometry
+
+        Takes the same arguments as polyfill and yields the same GIDs in the
+        same order. Descendants of fully covered cells are expanded lazily, so
+        results can be filtered, written or aggregated without materializing
+        them. With batch_size, GIDs are yielded as lists of at most
+        batch_size GIDs.
+        """
+        if feedback is None:
+            feedback = QgsProcessingFeedback()
+        keys = self._iter_contained_keys(
+            geometry,
+            start,
+            self._size_resolution(size),
+            feedback,
+            fullcover,
+            method,
+            batch_size or 1024,
         )
+        if batch_size:
+            yield from keys
+        else:
+            for batch in keys:
+                yield from batch
+
+    def iter_coverage(
+        self,
+        geometries: List[QgsGeometry],
+        size: int,
+        feedback: QgsProcessingFeedback = None,
+        tile_size: int = 10000,
+        centers: bool = False,
+    ) -> Iterator[Tuple[str, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Coverage of the grid cells at size by many geometries in one pass
+
+        Geometries are bucketed by the tile_size tiles overlapping their
+        bounding boxes, which serves as the spatial index: every tile is
+        rasterized once with the scanline core against its candidate
+        geometries only, instead of one polyfill per geometry.
+
+        Yields (tile, gids, owners, fractions, inside) per tile in GID order,
+        with one entry per cell and overlapping geometry sorted by GID then
+        geometry. owners are indexes into geometries and fractions the
+        covered fractions of the cells. With centers, inside flags the cells
+        whose center is inside the geometry, otherwise it is None.
+        """
+        assert size in self.size_level, f"size must be in {list(self.size_level.keys())}"
+        assert tile_size in self.size_level, f"tile_size must be in {list(self.size_level.keys())}"
+        if feedback is None:
+            feedback = QgsProcessingFeedback()
+        level = self.size_level[size]
+        tile_level = self.size_level[max(tile_size, size)]
+
+        polygons = []
+        bounds = []
+        buckets = collections.defaultdict(list)
+        for owner, geometry in enumerate(geometries):
+            parts = self._geometry_polygons(geometry)
+            polygons.append(parts)
+            bounds.append(geosquare_core.polygons_bounds(parts) if parts else None)
+            if not parts:
+                continue
+            window = geosquare_core.window_for_bounds(*bounds[owner], tile_level)
+            for row in range(window[1], window[3]):
+                for column in range(window[0], window[2]):
+                    buckets[(column, row)].append(owner)
+
+        tiles = sorted((geosquare_core.index_to_gid(column, row, tile_level), owners) for (column, row), owners in buckets.items())
+        for done, (tile, owners) in enumerate(tiles):
+            if feedback.isCanceled():
+                return
+            tile_window = geosquare_core.cell_window(tile, level)
+            columns, rows, owner_ids, fractions, inside = [], [], [], [], []
+            for owner in owners:
+                window = geosquare_core.intersect_windows(
+                    tile_window, geosquare_core.window_for_bounds(*bounds[owner], level)
+                )
+                for cell_columns, cell_rows, cell_fractions in geosquare_core.polygon_coverage(polygons[owner], level, window):
+                    columns.append(cell_columns)
+                    rows.append(cell_rows)
+                    owner_ids.append(np.full(len(cell_columns), owner, dtype=np.int64))
+                    fractions.append(cell_fractions)
+                    if centers:
+                        # only partially covered cells need a point test
+                        cell_inside = cell_fractions >= 1 - 1e-9
+                        partial = np.flatnonzero(~cell_inside)
+                        x, y, _, _ = geosquare_core.index_to_bound_array(cell_columns[partial] + 0.5, cell_rows[partial] + 0.5, level)
+                        cell_inside[partial] = geosquare_core.points_in_polygons(x, y, polygons[owner])
+                        inside.append(cell_inside)
+            feedback.setProgress(int(100 * (done + 1) / len(tiles)))
+            if not columns:
+                continue
+            gids = geosquare_core.index_to_gid_array(np.concatenate(columns), np.concatenate(rows), level)
+            owner_ids = np.concatenate(owner_ids)
+            order = np.lexsort((owner_ids, gids))
+            yield tile, gids[order], owner_ids[order], np.concatenate(fractions)[order], np.concatenate(inside)[order] if centers else None
+
+    def _size_resolution(self, size: Union[int, List[int]]) -> List[int]:
+        """Convert a size or [min, max] sizes to [min, max] resolution levels"""
+        if isinstance(size, list):
+            assert size[0] > size[1], "size must be in [min, max] format"
+            assert size[0] in self.size_level, f"size must be in {list(self.size_level.keys())}"
+            assert size[1] in self.size_level, f"size must be in {list(self.size_level.keys())}"
+            return [self.size_level[i] for i in size]
+        assert size in self.size_level, f"size must be in {list(self.size_level.keys())}"
+        return [self.size_level[size], self.size_level[size]]
 
     def __repr__(self) -> str:
         """String representation of the grid"""
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ GeosquareGrid
+                                 A QGIS plugin
+ Geosquare Grid
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2025-04-17
+        copyright            : (C) 2025 by PT Geo Innovasi Nussantara
+        email                : admin@geosquare.ai
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'PT Geo Innovasi Nussantara'
+__date__ = '2025-04-17'
+__copyright__ = '(C) 2025 by PT Geo Innovasi Nussantara'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class GridCache:
+    """
+    Bounded LRU cache for per-cell results such as bounds and geometries.
+
+    Entries are partitioned by namespace (e.g. 'bound', 'geometry') and by
+    GID level, so that the millions of fine cells visited by a polyfill do
+    not evict the few coarse cells every traversal starts from. Each
+    partition holds at most its capacity entries and evicts the least
+    recently used one when full. The cache is safe to share between threads.
+    Cells visited only once, such as those of a polyfill traversal, should
+    bypass the cache, and long running users should clear() it when done.
+    """
+
+    def __init__(self, capacity: int = 4096, level_capacity: Optional[Dict[int, int]] = None):
+        self.capacity = capacity
+        self.level_capacity = dict(level_capacity or {})
+        self._partitions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def capacity_for(self, level: int) -> int:
+        """Get the capacity of the partitions holding cells at level"""
+        return self.level_capacity.get(level, self.capacity)
+
+    def set_capacity(self, capacity: int, level: Optional[int] = None) -> None:
+        """Set the capacity of every partition, or only of those at level"""
+        with self._lock:
+            if level is None:
+                self.capacity = capacity
+            else:
+                self.level_capacity[level] = capacity
+            for (namespace, partition_level), partition in self._partitions.items():
+                limit = self.capacity_for(partition_level)
+                while len(partition) > limit:
+                    partition.popitem(last=False)
+                    self.evictions += 1
+
+    def get_or_compute(self, namespace: str, level: int, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for key, computing and storing it on a miss"""
+        with self._lock:
+            partition = self._partitions.get((namespace, level))
+            if partition is not None and key in partition:
+                partition.move_to_end(key)
+                self.hits += 1
+                return partition[key]
+            self.misses += 1
+
+        value = compute()
+
+        limit = self.capacity_for(level)
+        if limit <= 0:
+            return value
+        with self._lock:
+            partition = self._partitions.setdefault((namespace, level), OrderedDict())
+            partition[key] = value
+            partition.move_to_end(key)
+            while len(partition) > limit:
+                partition.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        """Drop every cached entry and reset the counters"""
+        with self._lock:
+            self._partitions.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss/eviction counters and the number of cached entries"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': sum(len(partition) for partition in self._partitions.values()),
+            }
+
+    def __repr__(self) -> str:
+        """String representation of the cache"""
+        return f"GridCache(capacity={self.capacity}, {self.stats()})"
+
+
+# Cache shared by every GeosquareGrid created without an explicit cache
+shared_cache = GridCache()
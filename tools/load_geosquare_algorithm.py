@@ -42,6 +42,7 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterNumber,
                        QgsProcessingUtils)
 from .geosquare_grid import GeosquareGrid
+from .grid_cache import shared_cache
 from qgis.core import QgsField, QgsFields, QgsCoordinateReferenceSystem, QgsWkbTypes, QgsCoordinateTransform
 from PyQt5.QtCore import QVariant
 from qgis import processing
@@ -131,7 +132,7 @@ class OpenGeosquareAlgorithm(QgsProcessingAlgorithm):
                 break
             gid = feature[field]
             try:
-                geom = self.geosquare_grid.gid_to_geometry(gid)
+                geom = self.geosquare_grid.gid_to_geometry(gid, cached=False)
             except Exception as e:
                 feedback.reportError(self.tr(f'GID is not valid: {gid}'))
                 break
@@ -151,6 +152,13 @@ class OpenGeosquareAlgorithm(QgsProcessingAlgorithm):
         feedback.pushInfo(self.tr('Processing completed.'))
         return {self.OUTPUT: dest_id}
 
+    def postProcessAlgorithm(self, context, feedback):
+        """
+        Releases the grid cells cached while the algorithm ran.
+        """
+        shared_cache.clear()
+        return {}
+
     def name(self):
         """
         Returns the algorithm name, used for identifying the algorithm. This
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ GeosquareGrid
+                                 A QGIS plugin
+ Geosquare Grid
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2025-04-17
+        copyright            : (C) 2025 by PT Geo Innovasi Nussantara
+        email                : admin@geosquare.ai
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+On-disk pixel-to-cell index of raster tiles. Rasters sharing a grid, e.g. a
+time series, are aggregated over the same boundary and level with the index
+computed once. This module must not import QGIS.
+"""
+
+__author__ = 'PT Geo Innovasi Nussantara'
+__date__ = '2025-04-17'
+__copyright__ = '(C) 2025 by PT Geo Innovasi Nussantara'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import hashlib
+import os
+import uuid
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+# bump when the layout of stored indexes changes
+FORMAT_VERSION = 3
+
+
+def index_key(*parts) -> str:
+    """Name of the index of a raster grid, boundary and level given by parts such as the geotransform"""
+    return hashlib.sha1(repr((FORMAT_VERSION,) + parts).encode('utf-8')).hexdigest()
+
+
+class PixelIndexStore:
+    """
+    Pixel-to-cell indexes of the tiles of one raster grid, stored as .npy
+    files in a directory per index key.
+
+    The index of a tile holds the GIDs of its cells, the row-major positions
+    of the assigned pixels in the tile window in ascending order, the cell
+    of every assigned pixel and, for coverage weighting or cells holding at
+    most one pixel center, the pixel weights. Pixel arrays are memory mapped
+    when loaded, so aggregating a raster is a gather and a bincount over
+    them. Files are written atomically, every tile is written by a single
+    thread.
+    """
+
+    def __init__(self, directory: str, key: str):
+        self.directory = os.path.join(directory, key)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, tile: str, name: str) -> str:
+        return os.path.join(self.directory, f'{tile}.{name}.npy')
+
+    def load(self, tile: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+        """(cells, pixels, groups, weights) of tile, None when it is not stored yet"""
+        # groups are written last, their file marks a complete index
+        if not os.path.exists(self._path(tile, 'groups')):
+            return None
+        weights = None
+        if os.path.exists(self._path(tile, 'weights')):
+            weights = np.load(self._path(tile, 'weights'), mmap_mode='r')
+        return (
+            np.load(self._path(tile, 'cells')),
+            np.load(self._path(tile, 'pixels'), mmap_mode='r'),
+            np.load(self._path(tile, 'groups'), mmap_mode='r'),
+            weights,
+        )
+
+    def save(self, tile: str, cells: Sequence[str], pixels: np.ndarray, groups: np.ndarray, weights: Optional[np.ndarray] = None):
+        """Store the index of tile"""
+        arrays = [
+            ('cells', np.asarray(cells, dtype=str)),
+            ('pixels', np.asarray(pixels, dtype=np.int32)),
+        ]
+        if weights is not None:
+            arrays.append(('weights', np.asarray(weights, dtype=np.float64)))
+        arrays.append(('groups', np.asarray(groups, dtype=np.int32)))
+        for name, array in arrays:
+            path = self._path(tile, name)
+            temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(temporary, 'wb') as file:
+                np.save(file, array)
+            os.replace(temporary, path)
@@ -39,6 +39,11 @@ grid_size = {
     '10 km': 10000,
 }
 
+polyfill_method = {
+    'Scanline': 'scanline',
+    'Prepared geometry': 'prepared',
+}
+
 from qgis.PyQt.QtCore import QCoreApplication
 from qgis.core import (QgsProcessing,
                        QgsFeatureSink,
@@ -46,8 +51,11 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterBoolean,
-                       QgsProcessingParameterEnum)
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterNumber)
 from .geosquare_grid import GeosquareGrid
+from .grid_cache import shared_cache
+from . import process_pool
 from qgis.core import QgsField, QgsFields, QgsCoordinateReferenceSystem, QgsWkbTypes, QgsCoordinateTransform
 from PyQt5.QtCore import QVariant
 from qgis import processing
@@ -76,6 +84,8 @@ class PolyfillAlgorithm(QgsProcessingAlgorithm):
     INPUT = 'INPUT'
     FULLCOVER = 'FULLCOVER'
     GRIDSIZE = 'GRIDSIZE'
+    METHOD = 'METHOD'
+    WORKERS = 'WORKERS'
 
     def initAlgorithm(self, config):
         """
@@ -127,6 +137,33 @@ class PolyfillAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        # We add the polyfill engine parameter
+        # Scanline rasterizes the polygon edges directly at the grid size and
+        # is the fastest choice for fine grids
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.METHOD,
+                self.tr('Polyfill engine'),
+                options=list(polyfill_method.keys()),
+                defaultValue=0,
+                allowMultiple=False,
+                optional=True
+            )
+        )
+
+        # We add the number of worker processes, one per CPU core by default,
+        # tiles are polyfilled in parallel with the scanline engine
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.WORKERS,
+                self.tr('Worker processes'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=process_pool.default_workers(),
+                minValue=1,
+                optional=True
+            )
+        )
+
     def processAlgorithm(self, parameters, context, feedback):
         """
         Here is where the processing itself takes place.
@@ -159,6 +196,28 @@ class PolyfillAlgorithm(QgsProcessingAlgorithm):
             transform = QgsCoordinateTransform(source.sourceCrs(), crs, context.project())
             geometry.transform(transform)
 
+        method = polyfill_method[list(polyfill_method.keys())[self.parameterAsEnum(parameters, self.METHOD, context)]]
+        size = grid_size[list(grid_size.keys())[self.parameterAsEnum(parameters, self.GRIDSIZE, context)]]
+        fullcover = self.parameterAsBool(parameters, self.FULLCOVER, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+
+        # Fan the 10 km tiles out to worker processes
+        if method == 'scanline' and workers > 1:
+            feedback.pushInfo(self.tr(f'Polyfilling 10 km tiles with {workers} worker processes.'))
+            self.geosquare_grid.polyfill_parallel(
+                geometry,
+                size,
+                feedback=feedback,
+                workers=workers,
+                fullcover=fullcover,
+                sink=sink,
+            )
+            feedback.setProgress(100)
+            return {self.OUTPUT: dest_id}
+        if workers > 1:
+            # prepared geometries are QGIS objects the workers cannot use
+            feedback.pushInfo(self.tr('Worker processes are only used by the Scanline engine, polyfilling in a single process.'))
+
         gid10km = self.geosquare_grid.polyfill(
             geometry,
             10000,
@@ -172,12 +231,13 @@ class PolyfillAlgorithm(QgsProcessingAlgorithm):
             if feedback.isCanceled():
                 break
             self.geosquare_grid.polyfill(
-                self.geosquare_grid.gid_to_geometry(g10km).intersection(geometry),
-                grid_size[list(grid_size.keys())[self.parameterAsEnum(parameters, self.GRIDSIZE, context)]],
+                self.geosquare_grid.gid_to_geometry(g10km, cached=False).intersection(geometry),
+                size,
                 feedback=feedback,
                 start=g10km,
                 sink=sink,
-                fullcover=self.parameterAsBool(parameters, self.FULLCOVER, context),
+                fullcover=fullcover,
+                method=method,
             )
             # Update the progress bar
             current += total
@@ -186,6 +246,13 @@ class PolyfillAlgorithm(QgsProcessingAlgorithm):
 
         return {self.OUTPUT: dest_id}
 
+    def postProcessAlgorithm(self, context, feedback):
+        """
+        Releases the grid cells cached while the algorithm ran.
+        """
+        shared_cache.clear()
+        return {}
+
     def name(self):
         """
         Returns the algorithm name, used for identifying the algorithm. This
@@ -234,6 +301,15 @@ class PolyfillAlgorithm(QgsProcessingAlgorithm):
                             - Full coverage: Creates grid cells that intersect any part of the input polygon
                             - Interior only: Creates grid cells that fall completely within the input polygon
                             
+                            Two polyfill engines are available:
+                            - Scanline: Rasterizes the polygon edges row by row at the grid size, fastest for fine grids
+                            - Prepared geometry: Descends the grid hierarchy testing cells against the polygon
+                            
+                            With the Scanline engine the 10 km tiles are processed in parallel by the given number
+                            of worker processes (one per CPU core by default). The output is the same, in the same
+                            order, as with a single process. The Prepared geometry engine always runs in a single
+                            process.
+                            
                             This is particularly useful for:
                             - Creating uniform sampling grids for spatial analysis
                             - Generating reference grids for data collection
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ GeosquareGrid
+                                 A QGIS plugin
+ Geosquare Grid
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2025-04-17
+        copyright            : (C) 2025 by PT Geo Innovasi Nussantara
+        email                : admin@geosquare.ai
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Worker processes running the QGIS-free geosquare_core.
+
+Functions are sent to workers by module name. Importing them through the
+plugin package would import QGIS in every worker, so geosquare_core is
+loaded as a top-level module and the workers find it on their sys.path.
+"""
+
+__author__ = 'PT Geo Innovasi Nussantara'
+__date__ = '2025-04-17'
+__copyright__ = '(C) 2025 by PT Geo Innovasi Nussantara'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import importlib.util
+import multiprocessing
+import os
+import shutil
+import site
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+CORE_MODULE = 'geosquare_core'
+
+
+def load_core():
+    """Import geosquare_core as a top-level module whose functions can be sent to workers"""
+    module = sys.modules.get(CORE_MODULE)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(
+            CORE_MODULE, os.path.join(TOOLS_DIR, f'{CORE_MODULE}.py')
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[CORE_MODULE] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def python_executable() -> str:
+    """
+    Python interpreter for worker processes.
+
+    Inside QGIS sys.executable is usually the QGIS binary rather than Python,
+    so look for the interpreter QGIS ships with.
+    """
+    executable = sys.executable
+    if os.path.basename(executable).lower().startswith('python'):
+        return executable
+    candidates = [
+        os.path.join(sys.exec_prefix, 'pythonw.exe'),
+        os.path.join(sys.exec_prefix, 'python.exe'),
+        os.path.join(sys.exec_prefix, 'bin', f'python{sys.version_info[0]}.{sys.version_info[1]}'),
+        os.path.join(sys.exec_prefix, 'bin', 'python3'),
+        shutil.which('python3'),
+    ]
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return executable
+
+
+def default_workers() -> int:
+    """Default number of worker processes: one per CPU core"""
+    return os.cpu_count() or 1
+
+
+def create_pool(workers: int = None) -> ProcessPoolExecutor:
+    """Create a process pool whose workers can import geosquare_core"""
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(python_executable())
+    return ProcessPoolExecutor(
+        max_workers=workers or default_workers(),
+        mp_context=context,
+        initializer=site.addsitedir,
+        initargs=(TOOLS_DIR,),
+    )
@@ -40,23 +40,50 @@ grid_size = {
 }
 
 from qgis.PyQt.QtCore import QCoreApplication
-from qgis.core import (QgsProcessing,
+from qgis.core import (Qgis,
+                       QgsProcessing,
                        QgsFeatureSink,
                        QgsProcessingAlgorithm,
+                       QgsProcessingException,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterBand,
                        QgsProcessingParameterBoolean,
                        QgsProcessingParameterEnum,
+                       QgsProcessingParameterFile,
                        QgsProcessingParameterRasterLayer,
+                       QgsRasterBandStats,
                        QgsRasterLayer,
                        QgsProcessingParameterNumber,
-                       QgsProcessingUtils)
+                       QgsProcessingParameterString,
+                       QgsRectangle)
 from .geosquare_grid import GeosquareGrid
-from qgis.core import QgsField, QgsFields, QgsCoordinateReferenceSystem, QgsWkbTypes, QgsCoordinateTransform
+from .grid_cache import shared_cache
+from . import geosquare_core, pixel_index, process_pool, zonal_core
+from qgis.core import QgsField, QgsFields, QgsCoordinateReferenceSystem, QgsWkbTypes, QgsCoordinateTransform, QgsCsException
 from PyQt5.QtCore import QVariant
-from qgis import processing
-from qgis.core import QgsGeometry, QgsFeature, QgsVectorLayer
-import os
+from qgis.core import QgsGeometry, QgsFeature
+from concurrent.futures import ThreadPoolExecutor
+from osgeo import gdal, osr
+import collections
+import math
+import threading
+import uuid
+import numpy as np
+
+# pixels read at once by the passes reading a window in row strips
+STRIP_PIXELS = 1 << 22
+
+# numpy types of the raster data types read by the native zonal engine
+RASTER_DTYPES = {
+    Qgis.Byte: np.uint8,
+    Qgis.UInt16: np.uint16,
+    Qgis.Int16: np.int16,
+    Qgis.UInt32: np.uint32,
+    Qgis.Int32: np.int32,
+    Qgis.Float32: np.float32,
+    Qgis.Float64: np.float64,
+}
 
 
 class FromRasterAlgorithm(QgsProcessingAlgorithm):
@@ -81,8 +108,16 @@ class FromRasterAlgorithm(QgsProcessingAlgorithm):
     INPUT = 'INPUT'
     BOUNDARY = 'BOUNDARY'
     CALCULATETYPE = 'CALCULATETYPE'
+    PERCENTILES = 'PERCENTILES'
     GRIDSIZE = 'GRIDSIZE'
     BAND = 'BAND'
+    BANDS = 'BANDS'
+    REPROJECTION = 'REPROJECTION'
+    WORKERS = 'WORKERS'
+    SKIPNODATA = 'SKIPNODATA'
+    WEIGHTED = 'WEIGHTED'
+    QUANTILEBINS = 'QUANTILEBINS'
+    INDEXCACHE = 'INDEXCACHE'
 
     def prepareAlgorithm(self, parameters, context, feedback):
         """
@@ -138,6 +173,18 @@ class FromRasterAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        # multi-band selector, every selected band is aggregated from the same
+        # read of each tile and gets its own b<band>_ columns
+        self.addParameter(
+            QgsProcessingParameterBand(
+                self.BANDS,
+                self.tr('Raster bands (multi-band mode, overrides raster band)'),
+                parentLayerParameterName=self.INPUT,
+                optional=True,
+                allowMultiple=True
+            )
+        )
+
         # We add the input vector features source. It can have any kind of
         self.addParameter(
             QgsProcessingParameterFeatureSource(
@@ -157,19 +204,100 @@ class FromRasterAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
-        # We add a boolean parameter to determine if we want to only
-        # include features that are inside the polygon
+        # We add the statistics to calculate, all of them are computed in
+        # one pass over the pixels and written to one column each
         self.addParameter(
             QgsProcessingParameterEnum(
                 self.CALCULATETYPE,
                 self.tr('Calculate type'),
-                options=['Sum', 'Mean', 'Median', 'St Dev', 'Min', 'Max'],
-                defaultValue='Median',
+                options=['Sum', 'Mean', 'Median', 'St Dev', 'Min', 'Max', 'Count', 'Nodata count'],
+                defaultValue=[2],
+                allowMultiple=True,
+                optional=True
+            )
+        )
+
+        # We add percentiles to calculate, e.g. "10, 90"
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.PERCENTILES,
+                self.tr('Percentiles (comma separated, 0-100)'),
+                optional=True
+            )
+        )
+
+        # How a raster that is not in EPSG:4326 is reprojected: per tile, by
+        # mapping the centers of the source pixels to longitude/latitude, or
+        # by warping the whole raster before processing
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.REPROJECTION,
+                self.tr('Reprojection of rasters not in EPSG:4326'),
+                options=['Per tile (map source pixels to grid cells)', 'Warp whole raster up front'],
+                defaultValue=0,
                 allowMultiple=False,
                 optional=False
             )
         )
 
+        # skip tiles that GDAL reports as empty or that have no valid pixel
+        # once read, and cells without valid pixels
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.SKIPNODATA,
+                self.tr('Skip tiles and grid cells without valid pixels'),
+                defaultValue=True
+            )
+        )
+
+        # weight pixels by the exact fraction of their area inside each grid
+        # cell instead of assigning them to the cell containing their center
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.WEIGHTED,
+                self.tr('Weight pixels by the fraction covered by each grid cell'),
+                defaultValue=False
+            )
+        )
+
+        # median and percentiles from fixed-bin histograms over the value
+        # range of the raster under the boundary instead of sorting every
+        # pixel value, tiles are then read in row strips, 0 is exact
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.QUANTILEBINS,
+                self.tr('Histogram bins for median and percentiles (0 = exact)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=0,
+                minValue=0,
+                optional=True
+            )
+        )
+
+        # folder keeping the pixel to cell index of every tile, rasters with
+        # the same geotransform reuse it instead of assigning pixels again
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INDEXCACHE,
+                self.tr('Pixel index cache folder (reused by rasters on the same grid)'),
+                behavior=QgsProcessingParameterFile.Folder,
+                optional=True
+            )
+        )
+
+        # number of threads reading and aggregating tiles, raster reads and
+        # numpy reductions release the GIL
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.WORKERS,
+                self.tr('Worker threads'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=process_pool.default_workers(),
+                minValue=1,
+                optional=True
+            )
+        )
+
         # We add a grid size parameter
         # option select from 50 m, 100 m, 500 m, 1 km, 5 km, 10 km
         self.addParameter(
@@ -187,18 +315,25 @@ class FromRasterAlgorithm(QgsProcessingAlgorithm):
         """
         Here is where the processing itself takes place.
         """
+        bands = list(dict.fromkeys(self.parameterAsInts(parameters, self.BANDS, context))) or [self.parameterAsInt(parameters, self.BAND, context)]
+        statistics = [zonal_core.STATISTICS[idx] for idx in self.parameterAsEnums(parameters, self.CALCULATETYPE, context)]
+        percentiles = self.parse_percentiles(self.parameterAsString(parameters, self.PERCENTILES, context))
+        columns = self.statistic_columns(statistics, percentiles, bands)
+        if not columns:
+            raise QgsProcessingException(self.tr('Select at least one statistic or percentile.'))
+
         fields = QgsFields()
         fields.append(QgsField('gid', QVariant.String))
-        fields.append(QgsField('value', QVariant.Double))
-        
+        for _, key, name in columns:
+            fields.append(QgsField(name, QVariant.Int if key in ('count', 'nodata') else QVariant.Double))
+
         # Create a CRS using EPSG:4326 (WGS84)
         crs = QgsCoordinateReferenceSystem('EPSG:4326')
-        band = self.parameterAsInt(parameters, self.BAND, context)
-        feedback.pushInfo(self.tr(f'Using raster band: {band}'))
-        
+        feedback.pushInfo(self.tr(f'Using raster bands: {", ".join(str(band) for band in bands)}'))
+
+
         source = self.parameterAsRasterLayer(parameters, self.INPUT, context)
         boundary = self.parameterAsSource(parameters, self.BOUNDARY, context)
-        calculatetype = self.parameterAsEnum(parameters, self.CALCULATETYPE, context)
         size = grid_size[list(grid_size.keys())[self.parameterAsEnum(parameters, self.GRIDSIZE, context)]]
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT,
             context, fields, QgsWkbTypes.Polygon, crs)
@@ -217,20 +352,55 @@ class FromRasterAlgorithm(QgsProcessingAlgorithm):
             boundarygeometry.transform(transform)
 
         #  convert raster source to WGS84 if not already
-        if source.crs() != crs:
+        per_tile = source.crs() != crs and self.parameterAsEnum(parameters, self.REPROJECTION, context) == 0
+        if per_tile:
+            feedback.pushInfo(self.tr('Input layer is not in WGS84. Reprojecting per tile.'))
+        warped = None
+        if source.crs() != crs and not per_tile:
             feedback.pushInfo(self.tr('Input layer is not in WGS84. Converting to WGS84.'))
-            reproject = processing.run(
-                'gdal:warpreproject',
-                {
-                    'INPUT': source.source(),
-                    'TARGET_CRS': crs,
-                    'OUTPUT': 'TEMPORARY_OUTPUT'
-                },
-                context=context,
-                feedback=feedback,
-            )
-            source = QgsRasterLayer(reproject['OUTPUT'], 'reprojected')
-
+            warped = self.warp_to_memory(source, crs)
+            source = QgsRasterLayer(warped, 'reprojected', 'gdal')
+
+        workers = max(self.parameterAsInt(parameters, self.WORKERS, context), 1)
+        skip_nodata = self.parameterAsBool(parameters, self.SKIPNODATA, context)
+        weighted = self.parameterAsBool(parameters, self.WEIGHTED, context)
+        if weighted and per_tile:
+            feedback.pushInfo(self.tr('Coverage weighting needs pixels aligned with EPSG:4326, pixels reprojected per tile are assigned by their centers.'))
+            weighted = False
+        transform_context = context.transformContext()
+        histograms = None
+        quantile_bins = self.parameterAsInt(parameters, self.QUANTILEBINS, context)
+        if quantile_bins > 0 and any(key == 'median' or not isinstance(key, str) for _, key, _ in columns):
+            # value range of the pixels under the boundary only, grown by a
+            # cell for the pixels of cells crossing its edge
+            extent = boundarygeometry.boundingBox().buffered(geosquare_core.CELL_SIZE[self.geosquare_grid.size_level[size]])
+            if per_tile:
+                try:
+                    extent = QgsCoordinateTransform(crs, source.crs(), transform_context).transformBoundingBox(extent)
+                except QgsCsException:
+                    extent = source.dataProvider().extent()
+            histograms = self.value_ranges(source, bands, quantile_bins, extent)
+            feedback.pushInfo(self.tr(f'Estimating median and percentiles from {quantile_bins} bin histograms.'))
+        index_store = None
+        index_directory = self.parameterAsFile(parameters, self.INDEXCACHE, context)
+        if index_directory:
+            index_store = self.pixel_index_store(index_directory, source, boundarygeometry, size, per_tile, weighted)
+            feedback.pushInfo(self.tr(f'Using the pixel index in {index_store.directory}.'))
+        readers = threading.local()
+
+        def process_tile(g10km):
+            # providers and transforms are not thread safe, every worker
+            # thread gets its own
+            if not hasattr(readers, 'provider'):
+                readers.provider = source.dataProvider().clone()
+                readers.transforms = None
+                if per_tile:
+                    readers.transforms = (
+                        QgsCoordinateTransform(crs, source.crs(), transform_context),
+                        self.pixel_transform(source.crs()),
+                        self.pixel_transform(source.crs(), inverse=True),
+                    )
+            return self.processPart(boundarygeometry, g10km, bands, readers.provider, columns, size, readers.transforms, skip_nodata, weighted, histograms, index_store)
 
         try:
             parrentGID = self.geosquare_grid.polyfill(
@@ -239,147 +409,449 @@ class FromRasterAlgorithm(QgsProcessingAlgorithm):
                 feedback=feedback,
             )
             
+            # drop tiles stored as empty before any read
+            if skip_nodata:
+                parrentGID = self.tiles_with_data(parrentGID, source, bands, crs, transform_context if per_tile else None, feedback)
+
             count_10km = len(parrentGID)
             total = 100 / count_10km if count_10km else 0
             current = 0
 
-            # clip big raster to small raster by using the boundary from parentGID and save it to temporary file with filename gid10km
-            for g10km in parrentGID:
-                # Stop the algorithm if cancel button has been clicked
-                if feedback.isCanceled():
-                    break
-                # process each part
-                self.processPart(
-                    boundarygeometry,
-                    g10km,
-                    band,
-                    source,
-                    calculatetype,
-                    size,
-                    context,
-                    feedback,
-                    sink
-                )
-                # Update the progress bar
-                current += total
-                sink.flushBuffer()
-                feedback.setProgress(int(current))
-                
+            # worker threads read and aggregate the 10 km tiles, this thread
+            # is the single writer feeding the sink in tile order
+            feedback.pushInfo(self.tr(f'Processing {count_10km} tiles with {workers} worker threads.'))
+            remaining = iter(parrentGID)
+            pending = collections.deque()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while True:
+                    # Keep a bounded number of tiles in flight
+                    while len(pending) < 2 * workers and not feedback.isCanceled():
+                        g10km = next(remaining, None)
+                        if g10km is None:
+                            break
+                        pending.append((g10km, pool.submit(process_tile, g10km)))
+                    # Stop the algorithm if cancel button has been clicked
+                    if not pending or feedback.isCanceled():
+                        break
+                    g10km, future = pending.popleft()
+                    try:
+                        sink.addFeatures(future.result(), QgsFeatureSink.FastInsert)
+                    except Exception as e:
+                        feedback.reportError(f"Error processing part {g10km}: {str(e)}")
+                    # Update the progress bar
+                    current += total
+                    sink.flushBuffer()
+                    feedback.setProgress(int(current))
+                for _, future in pending:
+                    future.cancel()
+
             feedback.setProgress(100)
             feedback.pushInfo(self.tr('Processing completed.'))
             feedback.pushInfo(self.tr('Output layer created.'))
         except Exception as e:
             feedback.reportError(f"Error during processing: {str(e)}")
-            
+        finally:
+            # release the in-memory warped raster
+            if warped is not None:
+                source = None
+                gdal.Unlink(warped)
+
         return {self.OUTPUT: dest_id}
     
-    def processPart(self, boundarygeometry, g10km, band, source, calculatetype, size, context, feedback, sink):
-        geometry = self.geosquare_grid.gid_to_geometry(g10km)
-        vl = None
-        temp_output = os.path.join(QgsProcessingUtils.tempFolder(), f'{g10km}.tif')
-        
-        try:
-            vl = QgsVectorLayer("Polygon?crs=EPSG:4326", f"temp_{g10km}", "memory")
-            pr = vl.dataProvider()
-            f = QgsFeature()
-            f.setGeometry(geometry)
-            pr.addFeature(f)
-            vl.updateExtents()
-
-            clipped_result = processing.run(
-                'gdal:cliprasterbymasklayer',
-                {
-                    'INPUT': source.source(),
-                    'MASK': vl,
-                    'SOURCE_CRS': source.crs().authid(),
-                    'TARGET_CRS': 'EPSG:4326',
-                    'NODATA': None,
-                    'ALPHA_BAND': False,
-                    'CROP_TO_CUTLINE': True,
-                    'KEEP_RESOLUTION': True,
-                    'SET_RESOLUTION': False,
-                    'OUTPUT': temp_output
-                },
-                context=context,
-                is_child_algorithm=True
+    @staticmethod
+    def parse_percentiles(text):
+        """Parse a comma separated list of percentiles in [0, 100]"""
+        percentiles = []
+        for part in (text or '').replace(';', ',').split(','):
+            if not part.strip():
+                continue
+            try:
+                percentile = float(part)
+            except ValueError:
+                raise QgsProcessingException(f"Invalid percentile: {part.strip()}")
+            if not 0 <= percentile <= 100:
+                raise QgsProcessingException(f"Percentile must be between 0 and 100: {part.strip()}")
+            if percentile not in percentiles:
+                percentiles.append(percentile)
+        return percentiles
+
+    @staticmethod
+    def statistic_columns(statistics, percentiles, bands=(1,)):
+        """
+        Output (band, statistic key, column name) triples. Columns of several
+        bands are prefixed with b<band>_, a single statistic of a single band
+        keeps the 'value' column.
+        """
+        names = [(statistic, statistic) for statistic in statistics]
+        names += [(percentile, f"p{percentile:g}".replace('.', '_')) for percentile in percentiles]
+        if len(bands) > 1:
+            return [(band, key, f"b{band}_{name}") for band in bands for key, name in names]
+        if len(names) == 1:
+            return [(bands[0], names[0][0], 'value')]
+        return [(bands[0], key, name) for key, name in names]
+
+    @staticmethod
+    def warp_to_memory(source, crs):
+        """
+        Warp source to crs as a virtual raster in GDAL's in-memory file system.
+        Only the VRT description is stored, pixels are warped when read.
+        """
+        path = f'/vsimem/geosquare_{uuid.uuid4().hex}.vrt'
+        dataset = gdal.Warp(path, source.source(), format='VRT', dstSRS=crs.authid())
+        if dataset is None:
+            raise QgsProcessingException(f"Could not warp {source.source()} to {crs.authid()}")
+        # closing the dataset writes the VRT
+        dataset = None
+        return path
+
+    @staticmethod
+    def pixel_transform(source_crs, inverse=False):
+        """GDAL transformation of source CRS coordinates to EPSG:4326 longitude/latitude, or back with inverse"""
+        source_srs = osr.SpatialReference()
+        source_srs.ImportFromWkt(source_crs.toWkt(QgsCoordinateReferenceSystem.WKT_PREFERRED_GDAL))
+        target_srs = osr.SpatialReference()
+        target_srs.ImportFromEPSG(4326)
+        for srs in (source_srs, target_srs):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        if inverse:
+            return osr.CoordinateTransformation(target_srs, source_srs)
+        return osr.CoordinateTransformation(source_srs, target_srs)
+
+    def pixel_index_store(self, directory, source, boundarygeometry, size, per_tile, weighted):
+        """Store of the pixel to cell indexes of the tiles of source, keyed on its grid, the boundary and the level"""
+        provider = source.dataProvider()
+        extent = provider.extent()
+        key = pixel_index.index_key(
+            (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()),
+            (provider.xSize(), provider.ySize()),
+            source.crs().toWkt(),
+            boundarygeometry.asWkt(),
+            self.geosquare_grid.size_level[size],
+            per_tile,
+            weighted,
+        )
+        return pixel_index.PixelIndexStore(directory, key)
+
+    def value_ranges(self, source, bands, bins, extent):
+        """
+        Histogram bins (lower, upper, bins) per band over the exact value
+        range of the raster within extent, pixels outside extent are not
+        read.
+        """
+        provider = source.dataProvider()
+        extent = extent.intersect(provider.extent())
+        histograms = {}
+        for band in bands:
+            # statistics of every pixel, sampled ones could miss the extremes
+            stats = provider.bandStatistics(band, QgsRasterBandStats.Min | QgsRasterBandStats.Max, extent, 0)
+            lower, upper = stats.minimumValue, stats.maximumValue
+            if not (math.isfinite(lower) and math.isfinite(upper)):
+                lower, upper = 0.0, 1.0
+            histograms[band] = (lower, upper, bins)
+        return histograms
+
+    def tiles_with_data(self, tiles, source, bands, crs, transform_context, feedback):
+        """
+        Drop the tiles that GDAL reports as empty in every band, i.e. whose
+        blocks are not stored in a sparse raster and read as nodata. No pixel
+        is read, tiles that cannot be proven empty are kept and dropped after
+        their read when they have no valid pixel.
+        """
+        dataset = gdal.Open(source.source()) if source.providerType() == 'gdal' else None
+        if dataset is None:
+            return tiles
+        # empty blocks read as nodata only in bands with a nodata value
+        raster_bands = [dataset.GetRasterBand(band) for band in bands]
+        if any(band is None or band.GetNoDataValue() is None for band in raster_bands):
+            return tiles
+
+        provider = source.dataProvider()
+        transforms = None
+        if transform_context is not None:
+            transforms = (QgsCoordinateTransform(crs, source.crs(), transform_context), None)
+        kept = []
+        for g10km in tiles:
+            if feedback.isCanceled():
+                return tiles
+            try:
+                window = self.tile_window(provider, g10km, transforms)
+            except QgsCsException:
+                # keep tiles whose extent cannot be transformed, they are
+                # reported when processed
+                kept.append(g10km)
+                continue
+            if window[2] <= window[0] or window[3] <= window[1]:
+                continue
+            region = (window[0], window[1], window[2] - window[0], window[3] - window[1])
+            if any(band.GetDataCoverageStatus(*region)[0] != gdal.GDAL_DATA_COVERAGE_STATUS_EMPTY for band in raster_bands):
+                kept.append(g10km)
+        feedback.pushInfo(self.tr(f'Skipping {len(tiles) - len(kept)} of {len(tiles)} tiles without stored pixels.'))
+        return kept
+
+    def tile_window(self, provider, g10km, transforms=None):
+        """Pixel window of the raster covering a 10 km tile"""
+        extent = provider.extent()
+        raster_bounds = (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum())
+        raster_size = (provider.xSize(), provider.ySize())
+        bounds = self.geosquare_grid.gid_to_bound(g10km)
+        if transforms is not None:
+            rect = transforms[0].transformBoundingBox(QgsRectangle(*bounds))
+            bounds = (rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum())
+        window = zonal_core.pixel_window(raster_bounds, raster_size, bounds)
+        if transforms is not None:
+            # one pixel margin for tile edges curved in the source CRS
+            window = (
+                max(window[0] - 1, 0), max(window[1] - 1, 0),
+                min(window[2] + 1, raster_size[0]), min(window[3] + 1, raster_size[1]),
             )
-            
-            # process per part
-            self.process_zonal_statistics(
-                boundarygeometry,
+        return window
+
+    def processPart(self, boundarygeometry, g10km, bands, provider, columns, size, transforms=None, skip_nodata=False, weighted=False, histograms=None, index_store=None):
+        """Read the pixels covering a 10 km tile and return the features of its child grids"""
+        extent = provider.extent()
+        raster_bounds = (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum())
+        raster_size = (provider.xSize(), provider.ySize())
+
+        window = self.tile_window(provider, g10km, transforms)
+        if window[2] <= window[0] or window[3] <= window[1]:
+            return []
+        values = None
+        if histograms is None:
+            # read the pixels covering the tile in one block, tiles without a
+            # valid pixel end here
+            values = {band: self.read_block(provider, band, raster_bounds, raster_size, window) for band in bands}
+            if skip_nodata and all(np.isnan(block).all() for block in values.values()):
+                return []
+        # the pixel to cell assignment only depends on the raster grid, so
+        # it is shared by rasters with the same geotransform
+        index = index_store.load(g10km) if index_store is not None else None
+        if index is None:
+            index = self.tile_index(boundarygeometry, g10km, raster_bounds, raster_size, window, size, transforms, weighted)
+            if index_store is not None:
+                index_store.save(g10km, *index)
+        if len(index[0]) == 0:
+            return []
+
+        if histograms is not None:
+            # bounded memory, the tile is read in row strips
+            return self.process_streamed_statistics(index, provider, bands, raster_bounds, raster_size, window, columns, histograms, skip_nodata)
+        return self.process_zonal_statistics(index, values, columns, skip_nodata)
+
+    def tile_index(self, boundarygeometry, g10km, raster_bounds, raster_size, window, size, transforms=None, weighted=False):
+        """
+        Assign the pixels of a tile window to its child grids overlapping the
+        boundary. Returns the (cells, pixels, groups, weights) index of the
+        tile: the child grids, the row-major positions of the assigned pixels
+        in the window in ascending order, the child grid of every assigned
+        pixel and the fraction of every pixel inside its child grid. Without
+        weighted, fractions are only kept for child grids holding at most one
+        pixel center, see cover_sparse_cells.
+        """
+        # child grids overlapping the boundary, tested with a prepared geometry
+        child_grids = self.geosquare_grid.parrent_to_allchildren(
                 g10km,
-                band, 
-                clipped_result['OUTPUT'],
-                calculatetype,
                 size,
-                context,
-                feedback,
-                sink
+                geometry=boundarygeometry,
             )
-        except Exception as e:
-            feedback.reportError(f"Error processing part {g10km}: {str(e)}")
-        finally:
-            # Clean up resources
-            if vl is not None and vl.isValid():
-                del vl
-            
-            # Force garbage collection to release memory
-            import gc
-            gc.collect()
-            
+        if not child_grids:
+            return np.empty(0, dtype=str), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), None
+        level = self.geosquare_grid.size_level[size]
+        cell_window = geosquare_core.cell_window(g10km, level)
+        child_columns, child_rows, _ = geosquare_core.gid_to_index_array(child_grids)
+        child_slot = np.full((cell_window[2] - cell_window[0]) * (cell_window[3] - cell_window[1]), -1, dtype=np.intp)
+        child_slot[(child_rows - cell_window[1]) * (cell_window[2] - cell_window[0]) + (child_columns - cell_window[0])] = np.arange(len(child_grids))
+
+        x_centers, y_centers = zonal_core.pixel_centers(raster_bounds, raster_size, window)
+        weights = None
+        if weighted:
+            # pixel edges, pixels are split between the cells they overlap
+            x_edges, y_edges = zonal_core.pixel_edges(raster_bounds, raster_size, window)
+            pixel_rows, pixel_columns, slots, weights = zonal_core.pixel_cell_weights(x_edges, y_edges, level, cell_window)
+            pixels = pixel_rows * (window[2] - window[0]) + pixel_columns
+            # pixels split between cells are repeated, keep them in row order
+            order = np.argsort(pixels, kind='stable')
+            pixels, slots, weights = pixels[order], slots[order], weights[order]
+        else:
+            if transforms is None:
+                longitude, latitude = x_centers[None, :], y_centers[:, None]
+            else:
+                # pixel centers in longitude/latitude, the source pixels are
+                # assigned to grid cells without resampling
+                x_centers, y_centers = np.meshgrid(x_centers, y_centers)
+                points = np.array(transforms[1].TransformPoints(
+                    np.column_stack((x_centers.ravel(), y_centers.ravel())).tolist()
+                ), dtype=np.float64).reshape(x_centers.shape + (-1,))
+                longitude, latitude = points[..., 0], points[..., 1]
+            slots = zonal_core.cell_slots(longitude, latitude, level, cell_window).ravel()
+            pixels = np.arange(len(slots))
+        groups = np.where(slots >= 0, child_slot[slots], -1)
+        inside = groups >= 0
+        pixels, groups = pixels[inside], groups[inside]
+        child_grids = np.asarray(child_grids, dtype=str)
+        if weights is not None:
+            weights = weights[inside]
+        else:
+            pixels, groups, weights = self.cover_sparse_cells(child_grids, pixels, groups, raster_bounds, raster_size, window, transforms)
+        return child_grids, pixels.astype(np.int32), groups.astype(np.int32), weights
 
-    def process_zonal_statistics(self, boundarygeometry, g10km, band, clipped_output, calculatetype, size, context, feedback, sink):
-        vl = None
-        output_layer = None
-        
-        try:
-            child_grids = self.geosquare_grid.parrent_to_allchildren(
-                    g10km,
-                    size,
-                    as_feature=True,
-                )
-            # filter out the child grids that are only intersecting with the boundary
-            child_grids = [child for child in child_grids if child.geometry().intersects(boundarygeometry)]
-            vl = QgsVectorLayer("Polygon?crs=EPSG:4326&field=gid:string(0,0)", f"temp_{g10km}_part", "memory")
-            pr = vl.dataProvider()
-            for child in child_grids:
-                pr.addFeature(child)
-            # Map calculation type to statistics number
-            stat_value = calculatetype
-            output = processing.run(
-                "native:zonalstatisticsfb",
-                {
-                    'INPUT': vl,
-                    'INPUT_RASTER': clipped_output,
-                    'RASTER_BAND': band,
-                    'COLUMN_PREFIX': '_',
-                    'STATISTICS': [stat_value + 1],
-                    'OUTPUT': 'TEMPORARY_OUTPUT'
-                },
-                context=context,
-                is_child_algorithm=True
+    def cover_sparse_cells(self, child_grids, pixels, groups, raster_bounds, raster_size, window, transforms=None):
+        """
+        Like QGIS zonal statistics, child grids holding at most one pixel
+        center take every pixel they overlap, weighted by the fraction of the
+        pixel inside the child grid. The other child grids keep their pixel
+        centers with a weight of 1. Counts of small child grids are the
+        numbers of pixels they overlap, not the sum of the weights. Returns
+        the (pixels, groups, weights) of the tile index, weights are None
+        when no child grid is that small.
+        """
+        sparse = np.bincount(groups, minlength=len(child_grids)) <= 1
+        if not sparse.any():
+            return pixels, groups, None
+        cells = np.flatnonzero(sparse)
+        rects = np.column_stack(self.geosquare_grid.gid_to_bound_array(child_grids[cells]))
+        if transforms is not None:
+            # child grids in the source CRS, as the rectangle through the
+            # middles of their transformed edges
+            corners = rects[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2)
+            points = np.array(transforms[2].TransformPoints(corners.tolist()), dtype=np.float64)[:, :2].reshape(-1, 4, 2)
+            rects = np.column_stack((
+                (points[:, 0, 0] + points[:, 3, 0]) / 2,
+                (points[:, 0, 1] + points[:, 1, 1]) / 2,
+                (points[:, 1, 0] + points[:, 2, 0]) / 2,
+                (points[:, 2, 1] + points[:, 3, 1]) / 2,
+            ))
+            finite = np.isfinite(rects).all(axis=1)
+            cells, rects = cells[finite], rects[finite]
+        rect, cover_pixels, cover_weights = zonal_core.rect_pixel_weights(raster_bounds, raster_size, window, rects)
+
+        keep = ~sparse[groups]
+        pixels = np.concatenate((pixels[keep], cover_pixels))
+        groups = np.concatenate((groups[keep], cells[rect]))
+        weights = np.concatenate((np.ones(np.count_nonzero(keep)), cover_weights))
+        # pixels overlapping several child grids are repeated, keep them in row order
+        order = np.argsort(pixels, kind='stable')
+        return pixels[order], groups[order], weights[order]
+
+    @staticmethod
+    def read_block(provider, band, raster_bounds, raster_size, window):
+        """Read a pixel window of band as a float64 array with NaN for nodata"""
+        xmin, ymin, xmax, ymax = raster_bounds
+        xres = (xmax - xmin) / raster_size[0]
+        yres = (ymax - ymin) / raster_size[1]
+        width = window[2] - window[0]
+        height = window[3] - window[1]
+        # a pixel aligned extent reads the source pixels without resampling
+        block = provider.block(
+            band,
+            QgsRectangle(
+                xmin + window[0] * xres,
+                ymax - window[3] * yres,
+                xmin + window[2] * xres,
+                ymax - window[1] * yres,
+            ),
+            width,
+            height,
+        )
+        dtype = RASTER_DTYPES.get(block.dataType())
+        if dtype is None:
+            raise QgsProcessingException(f"Unsupported raster data type {block.dataType()}")
+        values = np.frombuffer(bytes(block.data()), dtype=dtype).reshape(height, width).astype(np.float64)
+
+        nodata = np.isnan(values)
+        if block.hasNoDataValue():
+            nodata |= values == block.noDataValue()
+        for value_range in provider.userNoDataValues(band):
+            nodata |= (values >= value_range.min()) & (values <= value_range.max())
+        values[nodata] = np.nan
+        return values
+
+    def process_zonal_statistics(self, index, values, columns, skip_nodata=False):
+        """
+        Aggregate the pixels of a tile window into features of the child
+        grids of its (cells, pixels, groups, weights) index, see tile_index.
+        """
+        child_grids, pixels, groups, weights = index
+        groups = np.asarray(groups, dtype=np.intp)
+
+        # every statistic of a band in one pass over its pixels, the pixel
+        # assignment is shared by all bands
+        results = {}
+        for band, band_values in values.items():
+            statistics, percentiles = self.band_statistics(columns, band)
+            results[band] = zonal_core.grouped_statistics(
+                groups,
+                band_values.ravel()[pixels],
+                len(child_grids),
+                statistics,
+                percentiles,
+                weights,
             )
-            # Load the output using QgsProcessingUtils to handle temp files properly
-            output_layer = QgsProcessingUtils.mapLayerFromString(output['OUTPUT'], context)
-            for feature in output_layer.getFeatures():
-                # Stop the algorithm if cancel button has been clicked
-                if feedback.isCanceled():
-                    break
-                # Add the new feature to the sink
-                sink.addFeature(feature, QgsFeatureSink.FastInsert)
-        except Exception as e:
-            feedback.reportError(f"Error in zonal statistics for {g10km}: {str(e)}")
-        finally:
-            # Clean up the temporary layers
-            if vl is not None and vl.isValid():
-                del vl
-            if output_layer is not None:
-                del output_layer
-            
-            # Force garbage collection to release memory
-            import gc
-            gc.collect()
+        return self.cell_features(child_grids, results, columns, skip_nodata)
 
+    def process_streamed_statistics(self, index, provider, bands, raster_bounds, raster_size, window, columns, histograms, skip_nodata=False):
+        """
+        Aggregate the pixels of a tile window like process_zonal_statistics,
+        reading the window in row strips of at most STRIP_PIXELS pixels. The
+        statistics of the strips merge into the child grids, median and
+        percentiles come from histograms with the (lower, upper, bins) of
+        every band.
+        """
+        child_grids, pixels, groups, weights = index
+        width = window[2] - window[0]
+        rows = max(STRIP_PIXELS // width, 1)
+        streamed = {band: zonal_core.GroupedStatistics(len(child_grids), histograms[band]) for band in bands}
+        for top in range(window[1], window[3], rows):
+            strip = (window[0], top, window[2], min(top + rows, window[3]))
+            # pixels are in row order, those of the strip are a slice
+            offset = (top - window[1]) * width
+            start, stop = np.searchsorted(pixels, [offset, offset + (strip[3] - strip[1]) * width])
+            if start == stop:
+                continue
+            strip_pixels = np.asarray(pixels[start:stop]) - offset
+            strip_groups = np.asarray(groups[start:stop], dtype=np.intp)
+            strip_weights = None if weights is None else np.asarray(weights[start:stop])
+            for band in bands:
+                values = self.read_block(provider, band, raster_bounds, raster_size, strip)
+                streamed[band].add(strip_groups, values.ravel()[strip_pixels], strip_weights)
+        results = {band: streamed[band].result(*self.band_statistics(columns, band)) for band in bands}
+        return self.cell_features(child_grids, results, columns, skip_nodata)
+
+    @staticmethod
+    def band_statistics(columns, band):
+        """Statistics and percentiles of the columns of band, with the count telling cells without data"""
+        statistics = [key for column_band, key, _ in columns if column_band == band and isinstance(key, str)] + ['count']
+        percentiles = [key for column_band, key, _ in columns if column_band == band and not isinstance(key, str)]
+        return statistics, percentiles
+
+    def cell_features(self, child_grids, results, columns, skip_nodata=False):
+        """Features of the child grids with the statistics of results per band"""
+        child_grids = np.asarray(child_grids, dtype=str).tolist()
+        with_data = np.zeros(len(child_grids), dtype=bool)
+        for result in results.values():
+            with_data |= result['count'] > 0
+        attributes = zip(*(
+            [None if math.isnan(value) else value for value in results[band][key].tolist()]
+            for band, key, _ in columns
+        ))
+
+        bounds = zip(*(bound.tolist() for bound in self.geosquare_grid.gid_to_bound_array(child_grids)))
+        features = []
+        for gid, bound, row, has_data in zip(child_grids, bounds, attributes, with_data.tolist()):
+            # cells without valid pixels have null statistics
+            if skip_nodata and not has_data:
+                continue
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(*bound)))
+            feature.setAttributes([gid, *row])
+            features.append(feature)
+        return features
+
+    def postProcessAlgorithm(self, context, feedback):
+        """
+        Releases the grid cells cached while the algorithm ran.
+        """
+        shared_cache.clear()
+        return {}
 
     def name(self):
         """
@@ -423,12 +895,21 @@ class FromRasterAlgorithm(QgsProcessingAlgorithm):
         
 The algorithm:
 - Takes a raster input and converts it to vector geosquare grids
-- Calculates statistics (Sum, Mean, Median, St Dev, Min, Max) for each grid cell
+- Calculates one or more statistics (Sum, Mean, Median, St Dev, Min, Max, Count, Nodata count) and percentiles for each grid cell in a single pass
+- Writes one column per statistic, or a single 'value' column when only one is selected
 - Supports multiple grid sizes (50m, 100m, 500m, 1km, 5km, 10km)
-- Allows selection of specific raster bands for analysis
+- Allows selection of one or several raster bands, several bands are read once per tile and written to b<band>_<statistic> columns
 - Uses a boundary layer to define the area of interest
-
-The output is a vector layer where each grid cell contains the calculated statistic value from the underlying raster pixels.
+- Reprojects rasters that are not in EPSG:4326 per tile by default, mapping source pixel centers to grid cells, or optionally warps the whole raster first to an in-memory virtual raster
+- Writes no intermediate files, tiles are read into memory as blocks
+- Optionally keeps the pixel to grid cell assignment of every tile in an index cache folder, so rasters on the same grid (e.g. a time series) over the same boundary and grid size are aggregated without recomputing it
+- Assigns each pixel to the grid cell containing its center, grid cells holding at most one pixel center (pixels larger than the cells) take every pixel they overlap weighted by its covered fraction, as QGIS zonal statistics do
+- Optionally weights pixels by the exact fraction of their area inside each grid cell (sum, mean and st dev) for every grid cell
+- Optionally estimates median and percentiles from fixed-bin histograms over the value range of the raster under the boundary, reading tiles in row strips, so memory is bounded by the number of bins instead of the number of pixels (accurate to one bin width, min and max stay exact)
+- Optionally skips tiles without any valid pixel and grid cells without valid pixels, tiles stored as empty in a sparse raster are skipped before they are read
+- Processes 10 km tiles in parallel worker threads (one per CPU core by default)
+
+The output is a vector layer where each grid cell contains the calculated statistic values from the underlying raster pixels.
 
 This is useful for standardizing raster data at different resolutions or for comparative analysis across datasets.
         """)
@@ -41,6 +41,7 @@ grid_size = {
 
 from qgis.PyQt.QtCore import QCoreApplication
 from qgis.core import (QgsProcessing,
+                       QgsProcessingException,
                        QgsFeatureSink,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterFeatureSource,
@@ -51,11 +52,15 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterNumber,
                        QgsProcessingUtils)
 from .geosquare_grid import GeosquareGrid
-from qgis.core import QgsField, QgsFields, QgsCoordinateReferenceSystem, QgsWkbTypes, QgsCoordinateTransform
+from .grid_cache import shared_cache
+from . import geosquare_core, zonal_core
+from qgis.core import QgsField, QgsFields, QgsCoordinateReferenceSystem, QgsWkbTypes, QgsCoordinateTransform, QgsCsException
 from PyQt5.QtCore import QVariant
 from qgis import processing
-from qgis.core import QgsGeometry, QgsFeature, QgsVectorLayer
+from qgis.core import QgsGeometry, QgsFeature, QgsRectangle, QgsVectorLayer
+import math
 import os
+import numpy as np
 
 
 class FromVectorAlgorithm(QgsProcessingAlgorithm):
@@ -80,6 +85,12 @@ class FromVectorAlgorithm(QgsProcessingAlgorithm):
     INPUT = 'INPUT'
     FIELD = 'FIELD'
     GRIDSIZE = 'GRIDSIZE'
+    BATCHSIZE = 'BATCHSIZE'
+    SIMPLIFY = 'SIMPLIFY'
+    MODE = 'MODE'
+    INTENSIVE = 'INTENSIVE'
+    ASSIGNMENT = 'ASSIGNMENT'
+    PRIORITY = 'PRIORITY'
 
     def initAlgorithm(self, config):
         """
@@ -107,7 +118,60 @@ class FromVectorAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
-        
+        # How attributes are transferred to the cells: copied from the
+        # polygon covering most of a cell, or apportioned by overlap area
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.MODE,
+                self.tr('Attribute transfer'),
+                options=['Copy attributes', 'Apportion by overlap area (one row per cell)'],
+                defaultValue=0,
+                allowMultiple=False,
+                optional=False
+            )
+        )
+
+        # Which polygon a cell is copied from when several overlap it, see
+        # zonal_core.ASSIGNMENTS
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.ASSIGNMENT,
+                self.tr('Cell assignment when copying attributes'),
+                options=[
+                    'Polygons covering more than half of the cell',
+                    'Largest overlap (one row per cell)',
+                    'Cell center inside polygon (one row per cell)',
+                    'Lowest priority field value (one row per cell)',
+                ],
+                defaultValue=0,
+                allowMultiple=False,
+                optional=False
+            )
+        )
+
+        # priority of the polygons for the priority assignment, lowest first
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.PRIORITY,
+                self.tr('Priority field (lowest value wins)'),
+                parentLayerParameterName=self.INPUT,
+                type=QgsProcessingParameterField.Numeric,
+                optional=True
+            )
+        )
+
+        # fields averaged rather than split in apportion mode, e.g. densities
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.INTENSIVE,
+                self.tr('Fields to average when apportioning (intensive, e.g. densities)'),
+                parentLayerParameterName=self.INPUT,
+                type=QgsProcessingParameterField.Numeric,
+                allowMultiple=True,
+                optional=True
+            )
+        )
+
 
         # We add a feature sink in which to store our processed features (this
         # usually takes the form of a newly created vector layer when the
@@ -132,6 +196,31 @@ class FromVectorAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        # simplification of the polygons before gridding, as a fraction of
+        # the grid cell size so that it scales with the grid level
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SIMPLIFY,
+                self.tr('Simplify tolerance (fraction of the grid cell size, 0 = none)'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue=0,
+                minValue=0,
+                optional=True
+            )
+        )
+
+        # number of features handed to the sink in one call
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BATCHSIZE,
+                self.tr('Features per write batch'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=10000,
+                minValue=1,
+                optional=True
+            )
+        )
+
     def processAlgorithm(self, parameters, context, feedback):
         """
         Here is where the processing itself takes place.
@@ -144,7 +233,15 @@ class FromVectorAlgorithm(QgsProcessingAlgorithm):
 
         source = self.parameterAsSource(parameters, self.INPUT, context)
         selected_fields = self.parameterAsFields(parameters, self.FIELD, context)
-        if selected_fields:
+        apportion = self.parameterAsEnum(parameters, self.MODE, context) == 1
+        if apportion:
+            # selected fields are split by area, intensive fields averaged
+            intensive_fields = [field for field in self.parameterAsFields(parameters, self.INTENSIVE, context) if field not in selected_fields]
+            extensive = [True] * len(selected_fields) + [False] * len(intensive_fields)
+            selected_fields = list(selected_fields) + intensive_fields
+            for field in selected_fields:
+                fields.append(QgsField(field, QVariant.Double))
+        elif selected_fields:
             for field in selected_fields:
                 fields.append(source.fields().field(field))
         
@@ -162,78 +259,141 @@ class FromVectorAlgorithm(QgsProcessingAlgorithm):
             feedback.pushInfo(self.tr('Input layer has no CRS.'))
             return {self.OUTPUT: dest_id}
 
-        # convert to WGS84 if not already
+        # convert to WGS84 if not already, while the layer is read
+        transform = None
         if source.sourceCrs() != crs:
             feedback.pushInfo(self.tr('Input layer is not in WGS84. Converting to WGS84.'))
             transform = QgsCoordinateTransform(source.sourceCrs(), crs, context.project())
-            for feature in source.getFeatures():
-                geom = feature.geometry().simplify(0.0004)
-                geom.transform(transform)
-                feature.setGeometry(geom)
-
-        count_features = source.featureCount()
-        total = 100 / count_features if count_features else 0
-        current = 0
-        for feature in source.getFeatures():
-            # Stop the algorithm if cancel button has been clicked
-            if feedback.isCanceled():
-                break
-            # process each feature
-            self.processFeature(
-                feature,
-                fields,
-                size,
-                sink,
-                feedback
-            )
-            # Update the progress bar
-            current += total
-            feedback.setProgress(int(current))
+
+        # simplification tolerance in degrees, relative to the grid cell size
+        tolerance = self.parameterAsDouble(parameters, self.SIMPLIFY, context) * geosquare_core.CELL_SIZE[self.geosquare_grid.size_level[size]]
+
+        # positions of the copied fields in the source attributes, looked
+        # up once rather than by name for every cell
+        attribute_indexes = [source.fields().indexFromName(field) for field in selected_fields or []]
+        batch_size = max(self.parameterAsInt(parameters, self.BATCHSIZE, context), 1)
+
+        assignment = zonal_core.ASSIGNMENTS[self.parameterAsEnum(parameters, self.ASSIGNMENT, context)]
+        priority_field = self.parameterAsString(parameters, self.PRIORITY, context)
+        if not apportion and assignment == 'priority':
+            if not priority_field:
+                raise QgsProcessingException(self.tr('Select a priority field for the priority assignment.'))
+            # read the priorities along with the copied attributes
+            attribute_indexes.append(source.fields().indexFromName(priority_field))
+
+        # read the layer once, cells are then assigned tile by tile to the
+        # features overlapping them
+        geometries, attributes = self.read_features(source, attribute_indexes, transform, tolerance, feedback)
+        if feedback.isCanceled():
+            return {self.OUTPUT: dest_id}
+        priorities = None
+        if not apportion and assignment == 'priority':
+            priorities = np.array([self.numeric(row.pop()) for row in attributes], dtype=np.float64)
+
+        if apportion:
+            values = np.array([[self.numeric(value) for value in row] for row in attributes], dtype=np.float64).reshape(len(attributes), len(selected_fields))
+            # polygon areas in cell areas, the cells of a level are equal in degrees
+            areas = np.array([geometry.area() for geometry in geometries]) / geosquare_core.CELL_SIZE[self.geosquare_grid.size_level[size]] ** 2
+
+        batch = []
+        centers = not apportion and assignment == 'center'
+        for tile, gids, owners, fractions, inside in self.geosquare_grid.iter_coverage(geometries, size, feedback, centers=centers):
+            if apportion:
+                batch.extend(self.apportionTile(gids, owners, fractions, values, areas, extensive, fields))
+            else:
+                # the per tile cell to polygon assignment, by default a
+                # feature gets the cells it covers by more than half, as
+                # polyfill with fullcover=False
+                selected = zonal_core.assign_cells(gids, owners, fractions, assignment, inside, priorities)
+                batch.extend(self.processTile(
+                    attributes,
+                    gids[selected],
+                    owners[selected],
+                    fields,
+                ))
+            # hand features to the sink in chunks of batch_size
+            while len(batch) >= batch_size:
+                sink.addFeatures(batch[:batch_size], QgsFeatureSink.FastInsert)
+                del batch[:batch_size]
+        if batch:
+            sink.addFeatures(batch, QgsFeatureSink.FastInsert)
         feedback.setProgress(100)
         feedback.pushInfo(self.tr('Processing completed.'))
         return {self.OUTPUT: dest_id}
 
 
-    def processFeature(self, feature, fields, size, sink, feedback):
+    def read_features(self, source, attribute_indexes, transform=None, tolerance=0, feedback=None):
         """
-        Process each feature and add it to the sink.
+        Read the features of source in one pass. Returns their geometries,
+        transformed with transform and simplified with tolerance in degrees
+        if given, and the values of their attributes at attribute_indexes.
         """
+        geometries = []
+        attributes = []
+        for feature in source.getFeatures():
+            if feedback is not None and feedback.isCanceled():
+                break
+            geometry = feature.geometry()
+            if transform is not None:
+                try:
+                    geometry.transform(transform)
+                except QgsCsException as e:
+                    if feedback is not None:
+                        feedback.reportError(f"Could not transform feature {feature.id()}: {str(e)}")
+                    continue
+            if tolerance > 0:
+                geometry = geometry.simplify(tolerance)
+            geometries.append(geometry)
+            values = feature.attributes()
+            attributes.append([values[idx] for idx in attribute_indexes])
+        return geometries, attributes
+
+    def apportionTile(self, gids, owners, fractions, values, areas, extensive, fields):
+        """
+        Features of the cells of a tile, one per cell, with the attributes of
+        the overlapping features apportioned by overlap area.
+        """
+        cells, groups = np.unique(gids, return_inverse=True)
+        apportioned = zonal_core.apportion(groups, len(cells), owners, fractions, values, areas, extensive)
+        bounds = zip(*(bound.tolist() for bound in self.geosquare_grid.gid_to_bound_array(cells)))
+        features = []
+        for gid, bound, row in zip(cells.tolist(), bounds, apportioned.tolist()):
+            feature = QgsFeature(fields)
+            feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(*bound)))
+            feature.setAttributes([gid] + [None if math.isnan(value) else value for value in row])
+            features.append(feature)
+        return features
+
+    @staticmethod
+    def numeric(value):
+        """Attribute value as a float, NaN for NULL and non-numeric values"""
         try:
-            gid_features = self.geosquare_grid.polyfill(
-                feature.geometry(),
-                size,
-                feedback=feedback,
-                fullcover=False,
-                as_feature=True,
-            )
-            # Add each generated feature to the sink
-            for gid_feature in gid_features:
-                # Get the GID value
-                gid_value = gid_feature.attributes()[0]  # First attribute is gid
-                
-                # Create a new feature with the defined fields
-                new_feature = QgsFeature(fields)
-                
-                # Set the GID field
-                new_feature.setAttribute('gid', gid_value)
-                
-                # Copy selected field values from the original feature
-                for field in fields:
-                    field_name = field.name()
-                    if field_name != 'gid' and feature.fields().indexFromName(field_name) >= 0:
-                        new_feature.setAttribute(field_name, feature[field_name])
-                
-                # Set geometry
-                new_feature.setGeometry(gid_feature.geometry())
-                
-                # Add to sink
-                sink.addFeature(new_feature, QgsFeatureSink.FastInsert)
-                sink.flushBuffer()
-            
-            
-        except Exception as e:
-            feedback.reportError(f"Error during processing: {str(e)}")
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    def processTile(self, attributes, gids, owners, fields):
+        """
+        Features of the cells of a tile with the attributes of the features
+        they are assigned to, attributes holds the copied values of every
+        feature.
+        """
+        bounds = zip(*(bound.tolist() for bound in self.geosquare_grid.gid_to_bound_array(gids)))
+        features = []
+        for gid, owner, bound in zip(gids.tolist(), owners.tolist(), bounds):
+            feature = QgsFeature(fields)
+            feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(*bound)))
+            feature.setAttributes([gid, *attributes[owner]])
+            features.append(feature)
+        return features
+
 
+    def postProcessAlgorithm(self, context, feedback):
+        """
+        Releases the grid cells cached while the algorithm ran.
+        """
+        shared_cache.clear()
+        return {}
 
     def name(self):
         """
@@ -285,7 +445,17 @@ Output:
 - A grid layer where:
   - Each cell has a unique geosquare ID (gid)
   - Selected attribute values from the input polygon are copied to all grid cells that fall within it
-  - Only cells that intersect with input polygons are created
+  - Only cells covered by more than half of their area by an input polygon are created
+
+Polygons not in EPSG:4326 are reprojected while the layer is read, optionally simplified with a tolerance relative to the grid cell size.
+
+When copying attributes, each cell is by default assigned to every polygon covering more than half of it. Alternatively, one polygon per cell is chosen in a single pass per tile: the one with the largest overlap, the one containing the cell center, or the one with the lowest priority field value (ties go to the larger overlap). Cells then appear once and joins on gid stay one-to-one.
+
+In apportion mode every overlapped cell is written once. The selected fields are treated as extensive (e.g. population) and split by the share of each polygon's area inside the cell, so totals are preserved. The fields to average are treated as intensive (e.g. densities) and averaged, weighted by overlap area. Overlap fractions are exact, computed per 10 km tile in one vectorized pass.
+
+Output cells are written to the sink in batches (10000 features by default) without flushing after every feature.
+
+Polygons are read once and bucketed by 10 km tile. Each tile is then rasterized once against the polygons overlapping it, instead of searching the grid from the top for every polygon.
 
 This is useful for converting irregular polygons to a regular grid format while preserving attribute data.
         """)
@@ -0,0 +1,610 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ GeosquareGrid
+                                 A QGIS plugin
+ Geosquare Grid
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2025-04-17
+        copyright            : (C) 2025 by PT Geo Innovasi Nussantara
+        email                : admin@geosquare.ai
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Zonal statistics of raster pixels over Geosquare cells. A pixel belongs to
+the cell containing its center, and cells holding at most one pixel center
+take the pixels they overlap weighted by the covered fraction, as in QGIS
+zonal statistics. Polygon attributes are apportioned to cells by their
+overlap. This module must not import QGIS.
+"""
+
+__author__ = 'PT Geo Innovasi Nussantara'
+__date__ = '2025-04-17'
+__copyright__ = '(C) 2025 by PT Geo Innovasi Nussantara'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import math
+from typing import Dict, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import geosquare_core
+
+# Statistics in the order of the CALCULATETYPE options
+STATISTICS = ('sum', 'mean', 'median', 'stdev', 'min', 'max', 'count', 'nodata')
+
+# Policies assigning cells to overlapping polygons, see assign_cells
+ASSIGNMENTS = ('majority', 'largest', 'center', 'priority')
+
+
+def pixel_window(
+    raster_bounds: Tuple[float, float, float, float],
+    raster_size: Tuple[int, int],
+    bounds: Tuple[float, float, float, float],
+) -> Tuple[int, int, int, int]:
+    """Pixel window (col_min, row_min, col_max, row_max), max exclusive, of the raster pixels covering bounds"""
+    xmin, ymin, xmax, ymax = raster_bounds
+    width, height = raster_size
+    xres = (xmax - xmin) / width
+    yres = (ymax - ymin) / height
+    col_min = min(max(math.floor((bounds[0] - xmin) / xres), 0), width)
+    col_max = min(max(math.ceil((bounds[2] - xmin) / xres), 0), width)
+    row_min = min(max(math.floor((ymax - bounds[3]) / yres), 0), height)
+    row_max = min(max(math.ceil((ymax - bounds[1]) / yres), 0), height)
+    return col_min, row_min, col_max, row_max
+
+
+def pixel_centers(
+    raster_bounds: Tuple[float, float, float, float],
+    raster_size: Tuple[int, int],
+    window: Tuple[int, int, int, int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """x centers of the window columns and y centers of the window rows (top to bottom)"""
+    xmin, ymin, xmax, ymax = raster_bounds
+    width, height = raster_size
+    xres = (xmax - xmin) / width
+    yres = (ymax - ymin) / height
+    x_centers = xmin + (np.arange(window[0], window[2]) + 0.5) * xres
+    y_centers = ymax - (np.arange(window[1], window[3]) + 0.5) * yres
+    return x_centers, y_centers
+
+
+def pixel_edges(
+    raster_bounds: Tuple[float, float, float, float],
+    raster_size: Tuple[int, int],
+    window: Tuple[int, int, int, int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """x edges of the window columns and y edges of the window rows (top to bottom)"""
+    xmin, ymin, xmax, ymax = raster_bounds
+    width, height = raster_size
+    xres = (xmax - xmin) / width
+    yres = (ymax - ymin) / height
+    x_edges = xmin + np.arange(window[0], window[2] + 1) * xres
+    y_edges = ymax - np.arange(window[1], window[3] + 1) * yres
+    return x_edges, y_edges
+
+
+def axis_overlaps(edges: np.ndarray, origin: float, cell_size: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Overlaps along one axis between the pixels delimited by consecutive
+    edges and the grid cells of cell_size starting at origin.
+
+    Returns (pixel, cell, fraction) arrays, fraction is the part of the
+    pixel length covered by the cell.
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    low = np.minimum(edges[:-1], edges[1:])
+    high = np.maximum(edges[:-1], edges[1:])
+    first = np.floor((low - origin) / cell_size).astype(np.int64)
+    last = np.ceil((high - origin) / cell_size).astype(np.int64) - 1
+    pixels, cells, fractions = [], [], []
+    for offset in range(int((last - first).max()) + 1 if len(first) else 0):
+        cell = first + offset
+        overlap = np.minimum(high, origin + (cell + 1) * cell_size) - np.maximum(low, origin + cell * cell_size)
+        keep = np.flatnonzero(overlap > 0)
+        pixels.append(keep)
+        cells.append(cell[keep])
+        fractions.append(overlap[keep] / (high[keep] - low[keep]))
+    if not pixels:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(pixels), np.concatenate(cells), np.concatenate(fractions)
+
+
+def pixel_cell_weights(
+    x_edges: np.ndarray,
+    y_edges: np.ndarray,
+    level: int,
+    window: Tuple[int, int, int, int],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Exact overlaps between the pixels of a north-up raster in EPSG:4326 and
+    the cells at level. Both grids are axis-aligned, so the covered part of
+    a pixel is the product of its covered parts along each axis.
+
+    Returns (pixel row, pixel column, cell slot, weight) arrays for every
+    overlapping pixel and cell, cell slots are as in cell_slots and weight
+    is the fraction of the pixel area inside the cell.
+    """
+    size = geosquare_core.CELL_SIZE[level]
+    pixel_columns, columns, x_fractions = axis_overlaps(x_edges, geosquare_core.LON_ORIGIN, size)
+    pixel_rows, rows, y_fractions = axis_overlaps(y_edges, geosquare_core.LAT_ORIGIN, size)
+    inside_x = (columns >= window[0]) & (columns < window[2])
+    inside_y = (rows >= window[1]) & (rows < window[3])
+    pixel_columns, columns, x_fractions = pixel_columns[inside_x], columns[inside_x], x_fractions[inside_x]
+    pixel_rows, rows, y_fractions = pixel_rows[inside_y], rows[inside_y], y_fractions[inside_y]
+
+    # every combination of an x overlap and a y overlap
+    slots = (rows[:, None] - window[1]) * (window[2] - window[0]) + (columns[None, :] - window[0])
+    shape = slots.shape
+    return (
+        np.broadcast_to(pixel_rows[:, None], shape).ravel(),
+        np.broadcast_to(pixel_columns[None, :], shape).ravel(),
+        slots.ravel(),
+        (y_fractions[:, None] * x_fractions[None, :]).ravel(),
+    )
+
+
+def unit_overlaps(low: np.ndarray, high: np.ndarray, count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Overlaps of the intervals [low, high) with the unit intervals [i, i + 1)
+    for 0 <= i < count. Returns (index, length) arrays with a row per
+    interval, lengths past the end of an interval are 0.
+    """
+    first = np.clip(np.floor(low), 0, count).astype(np.int64)
+    last = np.clip(np.ceil(high), 0, count).astype(np.int64)
+    span = max(int((last - first).max()), 0) if len(first) else 0
+    index = first[:, None] + np.arange(span)
+    length = np.minimum(high[:, None], index + 1) - np.maximum(low[:, None], index)
+    return index, np.where(index < last[:, None], np.maximum(length, 0), 0.0)
+
+
+def rect_pixel_weights(
+    raster_bounds: Tuple[float, float, float, float],
+    raster_size: Tuple[int, int],
+    window: Tuple[int, int, int, int],
+    rects: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Exact overlaps between axis-aligned rectangles (xmin, ymin, xmax, ymax)
+    in the raster CRS and the pixels of a window of a north-up raster. For
+    cells of a raster in EPSG:4326 the weights are those of
+    pixel_cell_weights.
+
+    Returns (rectangle, pixel, weight) arrays for every overlapping
+    rectangle and pixel, pixel is the row-major position in the window and
+    weight is the fraction of the pixel area inside the rectangle.
+    """
+    xmin, ymin, xmax, ymax = raster_bounds
+    xres = (xmax - xmin) / raster_size[0]
+    yres = (ymax - ymin) / raster_size[1]
+    rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+    width = window[2] - window[0]
+    # rectangle extents in pixels of the window, rows from the top
+    columns, x_fractions = unit_overlaps(
+        (rects[:, 0] - xmin) / xres - window[0], (rects[:, 2] - xmin) / xres - window[0], width)
+    rows, y_fractions = unit_overlaps(
+        (ymax - rects[:, 3]) / yres - window[1], (ymax - rects[:, 1]) / yres - window[1], window[3] - window[1])
+    weights = y_fractions[:, :, None] * x_fractions[:, None, :]
+    rect, y, x = np.nonzero(weights > 0)
+    return rect, rows[rect, y] * width + columns[rect, x], weights[rect, y, x]
+
+
+def cell_slots(longitude: np.ndarray, latitude: np.ndarray, level: int, window: Tuple[int, int, int, int]) -> np.ndarray:
+    """
+    Row-major index within the cell window at level of the cell containing
+    every pixel center, -1 for pixels outside the window. Coordinates are
+    broadcast, so a north-up raster in EPSG:4326 can pass its x centers as a
+    row and its y centers as a column.
+    """
+    longitude = np.asarray(longitude, dtype=np.float64)
+    latitude = np.asarray(latitude, dtype=np.float64)
+    finite = np.isfinite(longitude) & np.isfinite(latitude)
+    columns, rows = geosquare_core.lonlat_to_index_array(
+        np.where(finite, longitude, geosquare_core.LON_ORIGIN - 1),
+        np.where(finite, latitude, geosquare_core.LAT_ORIGIN - 1),
+        level,
+    )
+    inside = (columns >= window[0]) & (columns < window[2]) & (rows >= window[1]) & (rows < window[3])
+    slots = (rows - window[1]) * (window[2] - window[0]) + (columns - window[0])
+    return np.where(inside, slots, -1)
+
+
+def grouped_statistics(
+    groups: np.ndarray,
+    values: np.ndarray,
+    n_groups: int,
+    statistics: Sequence[str],
+    percentiles: Sequence[float] = (),
+    weights: np.ndarray = None,
+    histogram: Tuple[float, float, int] = None,
+) -> Dict[Union[str, float], np.ndarray]:
+    """
+    Statistics of values per group in a single pass, groups are integers in
+    [0, n_groups) and NaN values are nodata.
+
+    Returns an array of length n_groups per statistic name and per
+    percentile (keyed by the percentile in [0, 100]), NaN for groups
+    without valid values. The sum and the counts of such groups are 0.
+    Percentiles interpolate linearly between the closest ranks.
+
+    With weights, sum, mean and stdev weight every value, e.g. by the
+    covered fraction of its pixel. Counts and order statistics do not.
+
+    With histogram (lower, upper, bins), median and percentiles are read
+    from per group histograms instead of sorted values, see GroupedHistogram.
+    Min and max stay exact.
+    """
+    groups = np.asarray(groups, dtype=np.intp)
+    values = np.asarray(values, dtype=np.float64)
+    nodata = np.isnan(values)
+    result = {}
+    if 'nodata' in statistics:
+        result['nodata'] = np.bincount(groups[nodata], minlength=n_groups)
+    if nodata.any():
+        groups = groups[~nodata]
+        values = values[~nodata]
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[~nodata]
+
+    count = np.bincount(groups, minlength=n_groups)
+    empty = count == 0
+    if 'count' in statistics:
+        result['count'] = count
+
+    if weights is None:
+        weight_total = count
+        total = np.bincount(groups, weights=values, minlength=n_groups)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        weight_total = np.bincount(groups, weights=weights, minlength=n_groups)
+        total = np.bincount(groups, weights=weights * values, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(empty, np.nan, total / weight_total)
+    if 'sum' in statistics:
+        result['sum'] = total
+    if 'mean' in statistics:
+        result['mean'] = mean
+    if 'stdev' in statistics:
+        # Population standard deviation from deviations to the group mean
+        deviation = values - mean[groups]
+        squares = deviation * deviation if weights is None else weights * deviation * deviation
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result['stdev'] = np.where(empty, np.nan, np.sqrt(np.bincount(groups, weights=squares, minlength=n_groups) / weight_total))
+
+    ranks = {}
+    if 'min' in statistics:
+        ranks['min'] = 0
+    if 'max' in statistics:
+        ranks['max'] = 100
+    if 'median' in statistics:
+        ranks['median'] = 50
+    for percentile in percentiles:
+        ranks[percentile] = percentile
+    if ranks and histogram is not None:
+        lower, upper, bins = histogram
+        counts = GroupedHistogram(lower, upper, bins)
+        counts.add(groups, values)
+        quantiles = counts.quantiles(np.arange(n_groups), list(ranks.values()))
+        for key, rank in ranks.items():
+            result[key] = quantiles[rank]
+    elif ranks:
+        # Sort values within groups once, order statistics are then lookups
+        ordered = values[np.lexsort((values, groups))]
+        if len(ordered) == 0:
+            ordered = np.full(1, np.nan)
+        start = np.cumsum(count) - count
+        for key, rank in ranks.items():
+            position = np.maximum(count - 1, 0) * (rank / 100)
+            lower = np.floor(position).astype(np.intp)
+            upper = np.ceil(position).astype(np.intp)
+            low = ordered[np.minimum(start + lower, len(ordered) - 1)]
+            high = ordered[np.minimum(start + upper, len(ordered) - 1)]
+            value = low + (high - low) * (position - lower)
+            result[key] = np.where(empty, np.nan, value)
+    return result
+
+
+def apportion(
+    groups: np.ndarray,
+    n_groups: int,
+    owners: np.ndarray,
+    fractions: np.ndarray,
+    values: np.ndarray,
+    owner_areas: np.ndarray,
+    extensive: Sequence[bool],
+) -> np.ndarray:
+    """
+    Areal interpolation of polygon attributes over cells. Every (group,
+    owner, fraction) entry is the fraction of the cell area covered by a
+    polygon, values holds the attributes of every polygon with NaN for
+    missing values and owner_areas their areas in cell areas.
+
+    Extensive attributes such as counts are split by the share of the
+    polygon area inside the cell and summed, the others are averaged
+    weighted by the covered area. Returns an (n_groups, n_attributes) array,
+    NaN for groups not covered by a polygon with a value.
+    """
+    groups = np.asarray(groups, dtype=np.intp)
+    owners = np.asarray(owners, dtype=np.intp)
+    fractions = np.asarray(fractions, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(owner_areas), -1)[owners]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = fractions / np.asarray(owner_areas, dtype=np.float64)[owners]
+    result = np.full((n_groups, values.shape[1]), np.nan)
+    for column, is_extensive in enumerate(extensive):
+        valid = ~np.isnan(values[:, column])
+        weights = (shares if is_extensive else fractions)[valid]
+        total = np.bincount(groups[valid], weights=weights * values[valid, column], minlength=n_groups)
+        if is_extensive:
+            covered = np.bincount(groups[valid], minlength=n_groups) > 0
+            result[:, column] = np.where(covered, total, np.nan)
+        else:
+            weight_total = np.bincount(groups[valid], weights=weights, minlength=n_groups)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[:, column] = np.where(weight_total > 0, total / weight_total, np.nan)
+    return result
+
+
+def assign_cells(
+    groups: np.ndarray,
+    owners: np.ndarray,
+    fractions: np.ndarray,
+    policy: str,
+    centers: np.ndarray = None,
+    priorities: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Indexes of the (group, owner, fraction) entries kept by an assignment
+    policy of the ASSIGNMENTS, fractions being the covered fractions of the
+    cells. 'majority' keeps every owner covering more than half of a cell,
+    the other policies keep a single winner per cell: the largest overlap,
+    the owner containing the cell center (centers flags the entries), or
+    the owner with the lowest priority, ties going to the larger overlap.
+    Remaining ties go to the first owner. Returned indexes keep the entry
+    order.
+    """
+    groups = np.asarray(groups)
+    owners = np.asarray(owners)
+    fractions = np.asarray(fractions, dtype=np.float64)
+    if policy == 'majority':
+        return np.flatnonzero(fractions > 0.5)
+    candidates = np.arange(len(groups))
+    # overlaps equal up to rounding are ties
+    overlaps = -np.round(fractions, 9)
+    if policy == 'center':
+        candidates = np.flatnonzero(centers)
+        keys = (owners[candidates], groups[candidates])
+    elif policy == 'largest':
+        keys = (owners, overlaps, groups)
+    elif policy == 'priority':
+        priorities = np.asarray(priorities, dtype=np.float64)[owners]
+        keys = (owners, overlaps, np.where(np.isnan(priorities), np.inf, priorities), groups)
+    else:
+        raise ValueError(f"policy must be in {ASSIGNMENTS}")
+    ordered = candidates[np.lexsort(keys)]
+    first = np.ones(len(ordered), dtype=bool)
+    first[1:] = groups[ordered][1:] != groups[ordered][:-1]
+    return np.sort(ordered[first])
+
+
+class GroupedHistogram:
+    """
+    Fixed-bin histograms of values per group, for quantiles in memory
+    bounded by the number of groups and bins rather than of values.
+
+    Bins split [lower, upper) evenly, values outside fall in the first or
+    last bin. Only non-empty (group, bin) counts are stored, with the exact
+    minimum and maximum of every group. Histograms with the same bins merge
+    by adding counts, so partial results of different windows or tiles
+    combine into the same groups.
+    """
+
+    def __init__(self, lower: float, upper: float, bins: int = 1024):
+        if not upper > lower:
+            upper = lower + 1
+        self.lower = float(lower)
+        self.upper = float(upper)
+        self.bins = int(bins)
+        self.width = (self.upper - self.lower) / self.bins
+        # sorted group * bins + bin keys and their counts
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        # sorted groups and their exact extremes
+        self.groups = np.empty(0, dtype=np.int64)
+        self.minimum = np.empty(0)
+        self.maximum = np.empty(0)
+
+    def add(self, groups: np.ndarray, values: np.ndarray):
+        """Count values into the histograms of their groups, NaN values are skipped"""
+        groups = np.asarray(groups, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        groups, values = groups[valid], values[valid]
+        if len(values) == 0:
+            return
+        bins = np.clip(np.floor((values - self.lower) / self.width), 0, self.bins - 1).astype(np.int64)
+        keys = groups * self.bins + bins
+        n_keys = (int(groups.max()) + 1) * self.bins
+        if n_keys <= max(4 * len(keys), 1 << 16):
+            # dense counts are cheaper than sorting the keys
+            counts = np.bincount(keys, minlength=n_keys)
+            keys = np.flatnonzero(counts)
+            counts = counts[keys]
+        else:
+            keys, counts = np.unique(keys, return_counts=True)
+        n_groups = int(groups.max()) + 1
+        minimum = np.full(n_groups, np.inf)
+        maximum = np.full(n_groups, -np.inf)
+        np.minimum.at(minimum, groups, values)
+        np.maximum.at(maximum, groups, values)
+        present = np.flatnonzero(np.isfinite(minimum))
+        self._combine(keys, counts, present, minimum[present], maximum[present])
+
+    def merge(self, other: 'GroupedHistogram'):
+        """Add the counts of a histogram with the same bins"""
+        if (other.lower, other.upper, other.bins) != (self.lower, self.upper, self.bins):
+            raise ValueError('Histograms with different bins cannot be merged')
+        self._combine(other.keys, other.counts, other.groups, other.minimum, other.maximum)
+
+    def _combine(self, keys, counts, groups, minimum, maximum):
+        keys, inverse = np.unique(np.concatenate((self.keys, keys)), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate((self.counts, counts)), minlength=len(keys)).astype(np.int64)
+        self.keys = keys
+        groups = np.concatenate((self.groups, groups))
+        order = np.argsort(groups, kind='stable')
+        groups = groups[order]
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        self.groups = groups[starts]
+        self.minimum = np.minimum.reduceat(np.concatenate((self.minimum, minimum))[order], starts) if len(groups) else np.empty(0)
+        self.maximum = np.maximum.reduceat(np.concatenate((self.maximum, maximum))[order], starts) if len(groups) else np.empty(0)
+
+    def quantiles(self, groups: np.ndarray, percentiles: Sequence[float]) -> Dict[float, np.ndarray]:
+        """
+        Percentiles in [0, 100] of groups, NaN for groups without values.
+        Values are taken as evenly spread within their bin, so results are
+        within one bin width of the exact percentiles. 0 and 100 are the
+        exact minimum and maximum.
+        """
+        groups = np.asarray(groups, dtype=np.int64)
+        result = {}
+        if len(self.keys) == 0:
+            return {percentile: np.full(len(groups), np.nan) for percentile in percentiles}
+        index = np.minimum(np.searchsorted(self.groups, groups), len(self.groups) - 1)
+        found = self.groups[index] == groups
+        minimum = np.where(found, self.minimum[index], np.nan)
+        maximum = np.where(found, self.maximum[index], np.nan)
+
+        # cumulative counts over all keys, the keys of a group are contiguous
+        cumulative = np.cumsum(self.counts)
+        key_groups = self.keys // self.bins
+        first = np.searchsorted(key_groups, groups)
+        last = np.searchsorted(key_groups, groups, side='right')
+        before = np.where(first > 0, cumulative[np.maximum(first - 1, 0)], 0)
+        total = np.where(last > 0, cumulative[np.maximum(last - 1, 0)], 0) - before
+
+        def ranked(rank):
+            # value of the rank-th value of every group, assuming the values
+            # of a bin are evenly spread within it
+            target = before + rank
+            key = np.minimum(np.searchsorted(cumulative, target, side='right'), len(cumulative) - 1)
+            previous = cumulative[key] - self.counts[key]
+            position = (self.keys[key] % self.bins) + (target - previous + 0.5) / self.counts[key]
+            return np.clip(self.lower + position * self.width, minimum, maximum)
+
+        for percentile in percentiles:
+            # interpolate linearly between the closest ranks, as the exact path
+            position = np.maximum(total - 1, 0) * (percentile / 100)
+            low = ranked(np.floor(position))
+            value = low + (ranked(np.ceil(position)) - low) * (position - np.floor(position))
+            if percentile <= 0:
+                value = minimum
+            elif percentile >= 100:
+                value = maximum
+            result[percentile] = np.where(found, value, np.nan)
+        return result
+
+
+class GroupedStatistics:
+    """
+    Statistics of values per group added in parts, e.g. the row strips of
+    a tile, with the same results as grouped_statistics.
+
+    Counts, sums and the squared deviations behind the standard deviation
+    merge exactly, median and percentiles come from a GroupedHistogram with
+    the (lower, upper, bins) of histogram. Memory is bounded by the number
+    of groups and bins rather than of values.
+    """
+
+    def __init__(self, n_groups: int, histogram: Tuple[float, float, int]):
+        self.n_groups = n_groups
+        self.count = np.zeros(n_groups, dtype=np.int64)
+        self.nodata = np.zeros(n_groups, dtype=np.int64)
+        self.weight = np.zeros(n_groups)
+        self.total = np.zeros(n_groups)
+        # running weighted mean and sum of squared deviations from it
+        self.mean = np.zeros(n_groups)
+        self.squares = np.zeros(n_groups)
+        self.histogram = GroupedHistogram(*histogram)
+
+    def add(self, groups: np.ndarray, values: np.ndarray, weights: np.ndarray = None):
+        """Add values of groups, NaN values count as nodata"""
+        groups = np.asarray(groups, dtype=np.intp)
+        values = np.asarray(values, dtype=np.float64)
+        nodata = np.isnan(values)
+        self.nodata += np.bincount(groups[nodata], minlength=self.n_groups)
+        groups, values = groups[~nodata], values[~nodata]
+        if weights is None:
+            weights = np.ones(len(values))
+        else:
+            weights = np.asarray(weights, dtype=np.float64)[~nodata]
+
+        weight = np.bincount(groups, weights=weights, minlength=self.n_groups)
+        total = np.bincount(groups, weights=weights * values, minlength=self.n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(weight > 0, total / weight, 0)
+        deviation = values - mean[groups]
+        squares = np.bincount(groups, weights=weights * deviation * deviation, minlength=self.n_groups)
+        self._combine(np.bincount(groups, minlength=self.n_groups), weight, total, mean, squares)
+        self.histogram.add(groups, values)
+
+    def merge(self, other: 'GroupedStatistics'):
+        """Add the statistics of the same groups computed from other values"""
+        self.nodata += other.nodata
+        self._combine(other.count, other.weight, other.total, other.mean, other.squares)
+        self.histogram.merge(other.histogram)
+
+    def _combine(self, count, weight, total, mean, squares):
+        # pairwise update of the mean and the squared deviations
+        combined = self.weight + weight
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(combined > 0, weight / combined, 0)
+        delta = mean - self.mean
+        self.squares = self.squares + squares + delta * delta * self.weight * share
+        self.mean = self.mean + delta * share
+        self.count += count
+        self.weight = combined
+        self.total += total
+
+    def result(self, statistics: Sequence[str], percentiles: Sequence[float] = ()) -> Dict[Union[str, float], np.ndarray]:
+        """Statistics and percentiles per group, as returned by grouped_statistics"""
+        empty = self.count == 0
+        result = {}
+        if 'nodata' in statistics:
+            result['nodata'] = self.nodata
+        if 'count' in statistics:
+            result['count'] = self.count
+        if 'sum' in statistics:
+            result['sum'] = self.total
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if 'mean' in statistics:
+                result['mean'] = np.where(empty, np.nan, self.total / self.weight)
+            if 'stdev' in statistics:
+                result['stdev'] = np.where(empty, np.nan, np.sqrt(self.squares / self.weight))
+
+        ranks = {}
+        if 'min' in statistics:
+            ranks['min'] = 0
+        if 'max' in statistics:
+            ranks['max'] = 100
+        if 'median' in statistics:
+            ranks['median'] = 50
+        for percentile in percentiles:
+            ranks[percentile] = percentile
+        if ranks:
+            quantiles = self.histogram.quantiles(np.arange(self.n_groups), list(ranks.values()))
+            for key, rank in ranks.items():
+                result[key] = quantiles[rank]
+        return result